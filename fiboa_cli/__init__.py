@@ -3,10 +3,13 @@ import os
 import sys
 import time
 
+from concurrent.futures import ProcessPoolExecutor
+
 import click
 import pandas as pd
 
-from .const import COMPRESSION_METHODS, CORE_COLUMNS
+from . import schema_cache
+from .const import COMPRESSION_METHODS, CORE_COLUMNS, GEOJSONSEQ_EXTENSIONS
 from .convert import convert as convert_
 from .convert import list_all_converter_ids, list_all_converters
 from .create_geojson import create_geojson as create_geojson_
@@ -16,10 +19,12 @@ from .improve import improve as improve_
 from .merge import merge as merge_, DEFAULT_CRS
 from .jsonschema import jsonschema as jsonschema_
 from .rename_extension import rename_extension as rename_extension_
-from .util import (check_ext_schema_for_cli, log, parse_converter_input_files,
-                   parse_map, valid_file_for_cli, valid_file_for_cli_with_ext,
+from .report import Report, write_reports
+from .util import (check_ext_schema_for_cli, file_cache, log, parse_converter_input_files,
+                   parse_map, parse_sample, replay_log, run_with_log_buffer, init_worker,
+                   valid_file_for_cli, valid_file_for_cli_with_ext,
                    valid_files_folders_for_cli, valid_folder_for_cli)
-from .validate import validate as validate_
+from .validate import preload_schemas, validate as validate_
 from .validate_schema import validate_schema as validate_schema_
 from .version import __version__
 from .version import fiboa_version as fiboa_version_
@@ -76,7 +81,7 @@ def describe(file, json, num = 10, column = []):
 
 ## VALIDATE
 @click.command()
-@click.argument('files', nargs=-1, callback=lambda ctx, param, value: valid_files_folders_for_cli(value, ["parquet", "geoparquet", "json", "geojson"]))
+@click.argument('files', nargs=-1, callback=lambda ctx, param, value: valid_files_folders_for_cli(value, ["parquet", "geoparquet", "json", "geojson"] + GEOJSONSEQ_EXTENSIONS))
 @click.option(
     '--schema', '-s',
     type=click.STRING,
@@ -105,9 +110,75 @@ def describe(file, json, num = 10, column = []):
     '--data', '-d',
     is_flag=True,
     type=click.BOOL,
-    help='EXPERIMENTAL: Validate the data in the GeoParquet file. Enabling this might be slow or exceed memory. Default is False.',
+    help='EXPERIMENTAL: Validate the data in the GeoParquet file. Enabling this might be slow. Default is False.',
+    default=False
+)
+@click.option(
+    '--batch-size', '-b',
+    type=click.IntRange(min=1),
+    help='Number of rows that are loaded and validated at once if --data is provided. Defaults to one row group at a time.',
+    default=None
+)
+@click.option(
+    '--sample',
+    type=click.STRING,
+    callback=parse_sample,
+    help='Validates the data only for a random sample of the row groups if --data is provided. Either the minimum number of rows (e.g. 100000) or the fraction of row groups (e.g. 0.1 or 10%).',
+    default=None
+)
+@click.option(
+    '--seed',
+    type=click.INT,
+    help='Seed for the random sample of row groups (see --sample), so that the same row groups are validated again.',
+    default=None
+)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    help='Number of files that are validated in parallel. For a single GeoJSON file, the number of processes that validate the features.',
+    show_default=True,
+    default=1
+)
+@click.option(
+    '--threads', '-t',
+    type=click.IntRange(min=1),
+    help='Number of columns of a GeoParquet file that are validated in parallel if --data is provided.',
+    show_default=True,
+    default=1
+)
+@click.option(
+    '--offline',
+    is_flag=True,
+    type=click.BOOL,
+    help='Load remote schemas only from the schema cache, fails if a schema is not cached yet.',
+    default=False
+)
+@click.option(
+    '--cache-dir',
+    type=click.Path(file_okay=False),
+    help='Folder for the persistent schema cache. Defaults to ~/.cache/fiboa/schemas or the environment variable FIBOA_CACHE_DIR.',
+    default=None
+)
+@click.option(
+    '--clear-cache',
+    is_flag=True,
+    type=click.BOOL,
+    help='Remove all schemas from the persistent schema cache before validating.',
     default=False
 )
+@click.option(
+    '--format', 'output_format',
+    type=click.Choice(["text", "json"]),
+    help='Output format: human-readable text or a JSON report per file.',
+    show_default=True,
+    default="text"
+)
+@click.option(
+    '--report', '-r',
+    type=click.Path(exists=False),
+    help='Writes a report with the issues and the statistics (rows, bytes read, seconds per stage and rule) for each file. Parquet logs (*.parquet) are appended to as a folder with one file per run, otherwise a JSON file is written.',
+    default=None
+)
 @click.option(
     '--timer',
     is_flag=True,
@@ -116,18 +187,29 @@ def describe(file, json, num = 10, column = []):
     default=False,
     hidden=True
 )
-def validate(files, schema, ext_schema, fiboa_version, collection, data, timer):
+def validate(files, schema, ext_schema, fiboa_version, collection, data, batch_size, sample, seed, jobs, threads, offline, cache_dir, clear_cache, output_format, report, timer):
     """
-    Validates a fiboa GeoParquet or GeoJSON file.
+    Validates a fiboa GeoParquet, GeoJSON or GeoJSONSeq file.
     """
     start = time.perf_counter()
-    log(f"fiboa CLI {__version__} - Validator\n", "success")
+    report_file = report
+    json_output = output_format == "json"
+    if not json_output:
+        log(f"fiboa CLI {__version__} - Validator\n", "success")
+    schema_cache.configure(directory = cache_dir, offline = offline or None)
+    if clear_cache:
+        schema_cache.clear()
     config = {
         "schema": schema,
         "extension_schemas": ext_schema,
         "fiboa_version": fiboa_version,
         "collection": collection,
         "data": data,
+        "batch_size": batch_size,
+        "sample": sample,
+        "seed": seed,
+        "threads": threads,
+        "jobs": jobs,
     }
 
     if len(files) == 0:
@@ -135,31 +217,82 @@ def validate(files, schema, ext_schema, fiboa_version, collection, data, timer):
         sys.exit(1)
 
     exit = 0
-    for file in files:
-        log(f"Validating {file}", "info")
-        try:
-            start_step = time.perf_counter()
-            result = validate_(file, config)
-            if result:
-                log("\n  => VALID\n", "success")
+    reports = []
+
+    def handle_result(result, report, messages = None):
+        nonlocal exit
+        if messages is not None:
+            report.messages = messages
+            if not json_output:
+                replay_log(messages)
+        reports.append(report)
+        if result != 0:
+            exit = result
+
+    if jobs > 1 and len(files) > 1:
+        # Validate files in parallel, the log messages are buffered per file and printed in order
+        preload_schemas(config)
+        # Files are validated in parallel, so each file is validated by a single process
+        config["jobs"] = 1
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(file_cache, schema_cache.settings)) as executor:
+            futures = [executor.submit(run_with_log_buffer, validate_file, file, config, timer) for file in files]
+            for file, future in zip(files, futures):
+                try:
+                    (result, report), messages = future.result()
+                except Exception as e:
+                    result, report = 2, Report(file)
+                    messages = [(f"Validating {file}", "info", True), (f"\n  => UNKNOWN: {e}\n", "error", True)]
+                handle_result(result, report, messages)
+    else:
+        for file in files:
+            if json_output:
+                (result, report), messages = run_with_log_buffer(validate_file, file, config, timer)
+                handle_result(result, report, messages)
             else:
-                log("\n  => INVALID\n", "error")
-                exit = 1
+                handle_result(*validate_file(file, config, timer))
+
+    if report_file is not None:
+        try:
+            write_reports(report_file, reports)
         except Exception as e:
-            log(f"\n  => UNKNOWN: {e}\n", "error")
-            exit = 2
-        finally:
-            if timer:
-                end_step = time.perf_counter()
-                log(f"Validated {file} in {end_step - start_step:0.4f} seconds")
-
-    if timer:
+            log(e, "error")
+            exit = exit or 1
+
+    if json_output:
+        click.echo(json.dumps([report.to_dict() for report in reports], indent=2))
+    elif timer:
         end = time.perf_counter()
         log(f"All validated in {end - start:0.4f} seconds")
 
     sys.exit(exit)
 
 
+def validate_file(file, config, timer = False):
+    """Validates a single file and logs the result, returns the exit code and the report for the file"""
+    log(f"Validating {file}", "info")
+    report = Report(file)
+    exit = 0
+    start = time.perf_counter()
+    try:
+        result = validate_(file, config, report)
+        report.valid = result
+        if result:
+            log("\n  => VALID\n", "success")
+        else:
+            log("\n  => INVALID\n", "error")
+            exit = 1
+    except Exception as e:
+        log(f"\n  => UNKNOWN: {e}\n", "error")
+        exit = 2
+    finally:
+        end = time.perf_counter()
+        report.timings["total"] = end - start
+        if timer:
+            log(f"Validated {file} in {end - start:0.4f} seconds")
+
+    return exit, report
+
+
 ## VALIDATE SCHEMA
 @click.command()
 @click.argument('files', nargs=-1, callback=lambda ctx, param, value: valid_files_folders_for_cli(value, ["yaml", "yml"]))
@@ -408,13 +541,47 @@ def jsonschema(schema, out, fiboa_version, id_):
     help='Keep the source geometries as provided, i.e. this option disables that geomtries are made valid and converted to Polygons.',
     default=False
 )
-def convert(dataset, out, input, year, cache, source_coop, collection, compression, geoparquet1, mapping_file, original_geometries):
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    help='Number of parallel jobs to download, extract and read files and to fix geometries.',
+    show_default=True,
+    default=1
+)
+@click.option(
+    '--cache-max-size',
+    type=click.FloatRange(min=0),
+    help='Maximum size of the cache folder in GB. The least recently used downloads are removed from the cache if it gets larger.',
+    default=None
+)
+@click.option(
+    '--chunk-size',
+    type=click.IntRange(min=1),
+    help='Converts the data in chunks of the given number of rows to limit the memory usage. Migrations are applied per chunk.',
+    default=None
+)
+@click.option(
+    '--verbose', '-v',
+    is_flag=True,
+    type=click.BOOL,
+    help='Shows previews of the data before and after the migrations and the time, memory and rows per stage.',
+    default=False
+)
+@click.option(
+    '--profile',
+    type=click.Path(exists=False),
+    help='Writes the wall time, CPU time, peak memory and rows in/out per stage of the conversion to the given JSON file.',
+    default=None
+)
+def convert(dataset, out, input, year, cache, source_coop, collection, compression, geoparquet1, mapping_file, original_geometries, jobs, cache_max_size, chunk_size, verbose, profile):
     """
     Converts existing field boundary datasets to fiboa.
     """
     log(f"fiboa CLI {__version__} - Convert '{dataset}'\n", "success")
     try:
-        convert_(dataset, out, input, year, cache, source_coop, collection, compression, geoparquet1, mapping_file, original_geometries)
+        if cache_max_size is not None:
+            cache_max_size = int(cache_max_size * 1024 ** 3)
+        convert_(dataset, out, input, year, cache, source_coop, collection, compression, geoparquet1, mapping_file, original_geometries, jobs, cache_max_size, chunk_size, verbose, profile)
     except Exception as e:
         log(e, "error")
         sys.exit(1)
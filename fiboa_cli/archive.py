@@ -0,0 +1,184 @@
+import os
+import zipfile
+
+import py7zr
+import rarfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .util import log
+
+# Files that are not read through GDAL or that GDAL needs to write files next to (e.g. GFS files for GML),
+# archives with these files are extracted
+EXTRACT_EXTENSIONS = [".parquet", ".geoparquet", ".json", ".geojson", ".gml"]
+
+# Compression methods that GDAL can read in place (stored and deflate)
+VSIZIP_COMPRESSION = [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+
+
+def get_vsizip_path(archive, member):
+    return f"/vsizip/{os.path.abspath(archive)}/{member}"
+
+
+def get_vsizip_paths(archive, members):
+    """
+    Returns the GDAL paths to read the given members of a ZIP file in place.
+
+    Returns None if the archive needs to be extracted, i.e. if it's not a ZIP file, a member is missing,
+    can't be read through GDAL or uses a compression method that GDAL doesn't support.
+    Members can be files or folders (e.g. File Geodatabases).
+    """
+    if not zipfile.is_zipfile(archive):
+        return None
+
+    with zipfile.ZipFile(archive, "r") as zip_file:
+        infos = zip_file.infolist()
+
+    names = set(info.filename for info in infos)
+    paths = []
+    for member in members:
+        member = member.strip("/")
+        if os.path.splitext(member)[1].lower() in EXTRACT_EXTENSIONS:
+            return None
+
+        # Files that belong to the member: the file itself, sidecar files (e.g. .dbf for .shp) and folder contents
+        stem = os.path.splitext(member)[0]
+        related = [info for info in infos if info.filename.startswith(stem)]
+        is_folder = any(name.startswith(member + "/") for name in names)
+        if member not in names and not is_folder:
+            return None
+        if any(info.compress_type not in VSIZIP_COMPRESSION for info in related):
+            return None
+
+        paths.append(get_vsizip_path(archive, member))
+
+    return paths
+
+
+def get_members(names, members):
+    """
+    Returns the names of the files in an archive that are needed to read the given members.
+
+    This includes the members, their sidecar files (e.g. .shx, .dbf, .prj and .cpg for .shp) and the contents
+    of folders (e.g. File Geodatabases). Returns None if a member is not in the archive.
+    """
+    selected = []
+    for member in members:
+        member = member.strip("/")
+        stem = os.path.splitext(member)[0].lower()
+        found = False
+        for name in names:
+            path = name.rstrip("/")
+            if path == member or path.startswith(member + "/"):
+                found = True
+            elif os.path.splitext(path)[0].lower() != stem:
+                continue
+            if name not in selected:
+                selected.append(name)
+        if not found:
+            return None
+
+    return selected
+
+
+def split(names, sizes, parts):
+    """Splits the files into the given number of parts of similar size"""
+    parts = [[] for _ in range(max(1, min(parts, len(names))))]
+    totals = [0] * len(parts)
+    for name in sorted(names, key = lambda n: sizes.get(n, 0), reverse = True):
+        i = totals.index(min(totals))
+        parts[i].append(name)
+        totals[i] += sizes.get(name, 0)
+    return parts
+
+
+def make_dirs(folder, names):
+    """
+    Creates the folders for the files to extract upfront.
+
+    zipfile and rarfile don't create folders safely if multiple threads extract files into the same new folder.
+    """
+    for parent in set(os.path.dirname(os.path.join(folder, name)) for name in names):
+        os.makedirs(parent, exist_ok = True)
+
+
+def run_parallel(fn, parts):
+    if len(parts) > 1:
+        with ThreadPoolExecutor(max_workers = len(parts)) as executor:
+            futures = [executor.submit(fn, part) for part in parts]
+            for future in futures:
+                future.result()
+    elif len(parts) == 1:
+        fn(parts[0])
+
+
+def extract(archive, members, folder, jobs = 1):
+    """
+    Extracts the files needed to read the given members from a ZIP, 7Z or RAR file.
+
+    All files are extracted if no members are given or if a member is not in the archive.
+    The files of ZIP and RAR files are extracted in parallel, up to the given number of jobs.
+    """
+    if zipfile.is_zipfile(archive):
+        extract_zip(archive, members, folder, jobs)
+    elif py7zr.is_7zfile(archive):
+        extract_7z(archive, members, folder)
+    elif archive.endswith(".rar"):
+        extract_rar(archive, members, folder, jobs)
+    else:
+        raise ValueError(f"Only ZIP, 7Z and RAR files are supported for extraction: {archive}")
+
+
+def select(archive, all_names, members):
+    names = get_members(all_names, members) if len(members) > 0 else None
+    if names is None:
+        if len(members) > 0:
+            log(f"Not all files found in {archive}, extracting all files", "warning")
+        return all_names
+    return names
+
+
+def extract_zip(archive, members, folder, jobs = 1):
+    with zipfile.ZipFile(archive, "r") as zip_file:
+        sizes = {info.filename: info.file_size for info in zip_file.infolist()}
+
+    names = select(archive, list(sizes.keys()), members)
+
+    def extract_files(names):
+        # Each thread needs its own file handle
+        try:
+            with zipfile.ZipFile(archive, "r") as zip_file:
+                for name in names:
+                    zip_file.extract(name, folder)
+        except NotImplementedError as e:
+            if str(e) != "That compression method is not supported":
+                raise
+            import zipfile_deflate64
+            with zipfile_deflate64.ZipFile(archive, "r") as zip_file:
+                for name in names:
+                    zip_file.extract(name, folder)
+
+    make_dirs(folder, names)
+    run_parallel(extract_files, split(names, sizes, jobs))
+
+
+def extract_7z(archive, members, folder):
+    # Files in solid 7Z archives can't be decompressed independently, so extract them at once
+    with py7zr.SevenZipFile(archive, "r") as sz_file:
+        names = select(archive, sz_file.getnames(), members)
+        sz_file.extract(folder, targets = names)
+
+
+def extract_rar(archive, members, folder, jobs = 1):
+    with rarfile.RarFile(archive, "r") as rar_file:
+        sizes = {info.filename: info.file_size for info in rar_file.infolist()}
+
+    names = select(archive, list(sizes.keys()), members)
+
+    def extract_files(names):
+        with rarfile.RarFile(archive, "r") as rar_file:
+            for name in names:
+                rar_file.extract(name, folder)
+
+    make_dirs(folder, names)
+    run_parallel(extract_files, split(names, sizes, jobs))
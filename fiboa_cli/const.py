@@ -11,6 +11,12 @@ STAC_COLLECTION_SCHEMA = "http://schemas.stacspec.org/v{version}/collection-spec
 GEOPARQUET_SCHEMA = "https://geoparquet.org/releases/v{version}/schema.json"
 STAC_TABLE_EXTENSION = "https://stac-extensions.github.io/table/v1.2.0/schema.json"
 
+# File extensions of newline-delimited GeoJSON (GeoJSONSeq)
+GEOJSONSEQ_EXTENSIONS = ["geojsonl", "geojsons", "geojsonseq", "ndjson", "jsonl"]
+
+# GeoJSON files larger than this (in bytes) are streamed feature by feature if ijson is installed
+GEOJSON_STREAMING_SIZE = 100 * 1024 * 1024
+
 COMPRESSION_METHODS = ["brotli", "gzip", "lz4", "snappy", "zstd", "none"]
 
 CORE_COLUMNS = [
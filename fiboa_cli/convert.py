@@ -18,6 +18,11 @@ def convert(
         geoparquet1 = False,
         mapping_file = None,
         original_geometries = False,
+        jobs = 1,
+        cache_max_size = None,
+        chunk_size = None,
+        verbose = False,
+        profile_file = None,
     ):
     if dataset in IGNORED_DATASET_FILES:
         raise Exception(f"'{dataset}' is not a converter")
@@ -43,6 +48,11 @@ def convert(
         geoparquet1 = geoparquet1,
         mapping_file = mapping_file,
         original_geometries = original_geometries,
+        jobs = jobs,
+        cache_max_size = cache_max_size,
+        chunk_size = chunk_size,
+        verbose = verbose,
+        profile_file = profile_file,
     )
 
 def list_all_converter_ids():
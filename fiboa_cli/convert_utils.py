@@ -1,29 +1,38 @@
 from __future__ import annotations
 
 from copy import copy
-from io import StringIO
 import inspect
 from typing import Optional
 
+from .archive import extract, get_vsizip_paths
 from .const import STAC_TABLE_EXTENSION
+from .download_cache import (HashingWriter, create_entry, evict, get_remote_info, hash_file, is_valid,
+                             load_manifest, remove as remove_cached_file, save_manifest)
 from .version import fiboa_version
-from .util import log, get_fs, name_from_uri, to_iso8601
-from .parquet import create_parquet
+from .util import log, get_fs, name_from_uri, replay_log, run_with_log_buffer, to_iso8601
+from .parquet import ChunkedParquetWriter, create_parquet
+from .profiling import Profile, write_profile
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from fsspec.implementations.local import LocalFileSystem
+from geopandas.io.arrow import _arrow_to_geopandas
 from tempfile import TemporaryDirectory
 from shapely.geometry import box
 
 import os
 import re
 import json
+import multiprocessing
+import pickle
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
 import sys
-import zipfile
-import py7zr
+import time
 import flatdict
-import rarfile
 
 
 def convert(
@@ -100,8 +109,11 @@ def add_asset_to_collection(collection, output_file, rows = None, columns = None
     return c
 
 
-def stream_file(fs, src_uri, dst_file, chunk_size = 10 * 1024 * 1024):
+def stream_file(fs, src_uri, dst_file, chunk_size = 10 * 1024 * 1024, offset = 0):
     with fs.open(src_uri, mode='rb') as f:
+        if offset > 0:
+            # Raises a ValueError if the source doesn't support random access, e.g. HTTP without range requests
+            f.seek(offset)
         while True:
             chunk = f.read(chunk_size)
             if not chunk:
@@ -109,6 +121,64 @@ def stream_file(fs, src_uri, dst_file, chunk_size = 10 * 1024 * 1024):
             dst_file.write(chunk)
 
 
+def download_file(fs, uri, cache_fs, cache_file, remote = None):
+    """
+    Downloads a file into the cache.
+
+    Local caches are written to a .part file first, which is renamed once the download is complete.
+    The size, ETag and last modification date of the source (see get_remote_info, retrieved unless given)
+    are stored next to it in a .part.json file.
+    If a .part file exists from an interrupted download, the download resumes from there if the source has not
+    changed since and supports it (e.g. via HTTP range requests).
+    Returns the SHA-256 checksum of local files, None otherwise.
+    """
+    if not isinstance(cache_fs, LocalFileSystem):
+        with cache_fs.open(cache_file, mode='wb') as file:
+            stream_file(fs, uri, file)
+        return None
+
+    if remote is None:
+        remote = get_remote_info(fs, uri)
+    part_file = cache_file + ".part"
+    info_file = part_file + ".json"
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if offset > 0 and not can_resume(info_file, remote):
+        log(f"Source {uri} has changed since the download was interrupted, starting again", "warning")
+        offset = 0
+        os.remove(part_file)
+    if offset == 0:
+        with open(info_file, "w", encoding="utf-8") as f:
+            json.dump(remote, f)
+
+    sha256 = None
+    if offset > 0:
+        log(f"Resuming download of {uri} at {offset} bytes")
+        sha256 = hash_file(part_file)
+    try:
+        with open(part_file, mode='ab') as file:
+            writer = HashingWriter(file, sha256)
+            stream_file(fs, uri, writer, offset = offset)
+    except ValueError as e:
+        if offset == 0:
+            raise
+        log(f"Can't resume download of {uri}, starting again: {e}", "warning")
+        with open(part_file, mode='wb') as file:
+            writer = HashingWriter(file)
+            stream_file(fs, uri, writer)
+
+    os.replace(part_file, cache_file)
+    os.remove(info_file)
+    return writer.sha256.hexdigest()
+
+
+def can_resume(info_file, remote):
+    """Checks whether the source is known to be unchanged since the .part file was started"""
+    if not os.path.exists(info_file) or not any(value is not None for value in remote.values()):
+        return False
+    with open(info_file, encoding="utf-8") as f:
+        return json.load(f) == remote
+
+
 def normalize_geojson_properties(feature):
     # Convert properties of type dict to dot notation
     feature["properties"] = flatdict.FlatDict(feature["properties"], delimiter=".")
@@ -134,6 +204,119 @@ def read_geojson(path, **kwargs):
     return gpd.GeoDataFrame.from_features(obj, crs = "EPSG:4326")
 
 
+# Number of geometries per chunk when geometries are fixed in parallel
+GEOMETRY_CHUNK_SIZE = 10000
+
+
+def is_parquet(path):
+    return path.endswith(".parquet") or path.endswith(".geoparquet")
+
+
+def is_json(path):
+    return path.endswith(".json") or path.endswith(".geojson")
+
+
+def map_chunks(fn, data, jobs = 1, chunk_size = GEOMETRY_CHUNK_SIZE):
+    """
+    Applies a vectorized function to an array of geometries in chunks, in up to the given number of threads.
+
+    Shapely releases the GIL, so the chunks are processed in parallel. The order is preserved.
+    """
+    if jobs > 1 and len(data) > chunk_size:
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return np.concatenate(list(executor.map(fn, chunks)))
+    else:
+        return fn(data)
+
+
+def fix_geometries(gdf, jobs = 1):
+    """
+    Makes the geometries valid, explodes multi-part geometries and removes the Z dimension.
+
+    Only the invalid geometries are repaired, found in a pre-pass with a validity mask.
+    Missing geometries are not repaired and are dropped by the explode.
+    Returns the GeoDataFrame and the number of repaired geometries, exploded geometries and parts.
+    """
+    geometries = np.asarray(gdf.geometry.array)
+    # shapely.is_valid is False for missing geometries, but they can't be repaired
+    invalid = ~shapely.is_missing(geometries) & ~map_chunks(shapely.is_valid, geometries, jobs)
+    repaired = int(invalid.sum())
+    if repaired > 0:
+        geometries = geometries.copy()
+        geometries[invalid] = map_chunks(shapely.make_valid, geometries[invalid], jobs)
+        gdf.geometry = gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs)
+
+    parts = shapely.get_num_geometries(geometries)
+    multi = parts > 1
+    gdf = gdf.explode()
+
+    if gdf.geometry.array.has_z.any():
+        log("Removing Z geometry dimension", "info")
+        geometries = map_chunks(shapely.force_2d, np.asarray(gdf.geometry.array), jobs)
+        gdf.geometry = gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs)
+
+    return gdf, {"repaired": repaired, "exploded": int(multi.sum()), "parts": int(parts[multi].sum())}
+
+
+def log_geometry_stats(stats):
+    if stats.get("repaired", 0) > 0:
+        log(f"Repaired {stats['repaired']} invalid geometries", "info")
+    if stats.get("exploded", 0) > 0:
+        log(f"Exploded {stats['exploded']} multi-part geometries into {stats['parts']} geometries", "info")
+
+
+def use_arrow():
+    """Reading through Arrow streams requires pyogrio as I/O engine and GDAL 3.6 or later"""
+    if gpd.options.io_engine not in (None, "pyogrio"):
+        return False
+    try:
+        import pyogrio
+        return pyogrio.__gdal_version__ >= (3, 6, 0)
+    except ImportError:
+        return False
+
+
+# Converter used by the worker processes of BaseConverter.read_data
+reader_converter = None
+
+
+def init_reader(converter):
+    global reader_converter
+    if converter is not None:
+        reader_converter = converter
+
+
+def read_layer_in_worker(path, uri, layer, kwargs):
+    """Reads a file or layer in a worker process, returns an Arrow table (or a GeoDataFrame) and the log messages"""
+    gdf, messages = run_with_log_buffer(reader_converter.read_layer, path, uri, layer, **kwargs)
+    try:
+        result = (pa.table(gdf.to_arrow(index=True, geometry_encoding="WKB")), gdf.geometry.name, gdf.crs)
+    except pa.ArrowException:
+        # e.g. columns with mixed types, send the GeoDataFrame instead
+        result = gdf
+    return result, messages
+
+
+def concat_tables(results):
+    """
+    Concatenates the results of read_layer_in_worker into a GeoDataFrame.
+
+    Arrow tables with the same geometry column and CRS are concatenated without copying the data,
+    otherwise the data is concatenated with pandas.
+    """
+    tables = [r for r in results if isinstance(r, tuple)]
+    if len(tables) == len(results) and len(set(t[1] for t in tables)) == 1 and all(t[2] == tables[0][2] for t in tables):
+        try:
+            table = pa.concat_tables([t[0] for t in tables], promote_options="permissive")
+            return gpd.GeoDataFrame.from_arrow(table, geometry=tables[0][1])
+        except pa.ArrowException:
+            pass
+
+    gdfs = [gpd.GeoDataFrame.from_arrow(r[0], geometry=r[1]) if isinstance(r, tuple) else r for r in results]
+    return pd.concat(gdfs)
+
+
 class BaseConverter:
     bbox: Optional[tuple[float]] = None
     id: str = None
@@ -155,6 +338,10 @@ class BaseConverter:
     missing_schemas: dict[str, str] = {}
     extensions: set[str] = set()
 
+    # Source columns that custom migrations need in addition to the columns that are mapped, filtered or migrated.
+    # Converters with custom migrations only read a subset of the columns if this is set, see get_read_columns.
+    read_columns: Optional[set[str]] = None
+
     index_as_id = False
 
     def __init__(self, **kwargs):
@@ -171,6 +358,9 @@ class BaseConverter:
             if not key.startswith("_") and isinstance(item, (list, dict, set)):
                 setattr(self, key, copy(item))
 
+        # Statistics per stage of the conversion, see convert
+        self.profile = Profile(self.id)
+
     @property
     def ID(self):  # noqa backwards compatibility for function-based converters
         return self.id
@@ -187,8 +377,17 @@ class BaseConverter:
     def post_migrate(self, gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         return gdf
 
-    def download_files(self, uris, cache_folder=None):
-        """Download (and cache) files from various sources"""
+    def download_files(self, uris, cache_folder=None, jobs=1, cache_max_size=None):
+        """
+        Download (and cache) files from various sources, up to the given number of files are downloaded in parallel.
+
+        Files in ZIP archives are read in place (via GDAL's /vsizip/) if possible, otherwise the files needed
+        from the archives are extracted.
+
+        Downloads are recorded in a manifest in local cache folders. Cached files from the manifest are only reused
+        if they are complete and the source has not changed. If a maximum size (in bytes) is given,
+        the least recently used files are removed from the cache folder afterwards.
+        """
         if cache_folder is None:
             args = {}
             if sys.version_info.major >= 3 and sys.version_info.minor >= 12:
@@ -199,7 +398,15 @@ class BaseConverter:
         if isinstance(uris, str):
             uris = {uris: name_from_uri(uris)}
 
-        paths = []
+        cache_fs = get_fs(cache_folder)
+        if not cache_fs.exists(cache_folder):
+            cache_fs.makedirs(cache_folder)
+        managed = isinstance(cache_fs, LocalFileSystem)
+        manifest = load_manifest(cache_folder) if managed else {}
+        manifest_changed = False
+
+        files = []
+        downloads = []
         i = 0
         for uri, target in uris.items():
             i = i + 1
@@ -216,48 +423,83 @@ class BaseConverter:
                 name = target
 
             source_fs = get_fs(uri)
-            cache_fs = get_fs(cache_folder)
-            if not cache_fs.exists(cache_folder):
-                cache_fs.makedirs(cache_folder)
-
             if isinstance(source_fs, LocalFileSystem):
                 cache_file = uri
             else:
                 cache_file = os.path.join(cache_folder, name)
 
             zip_folder = os.path.join(cache_folder, "extracted." + os.path.splitext(name)[0])
-            must_extract = is_archive and not os.path.exists(zip_folder)
+            # Only the files needed are extracted, so check that all of them are available
+            extracted = is_archive and os.path.exists(zip_folder) and all(os.path.exists(os.path.join(zip_folder, f)) for f in target)
+
+            # Files that are not in the manifest, e.g. added by the user, are used as they are
+            entry = manifest.get(name) if cache_file != uri else None
+            if entry is not None:
+                if is_valid(entry, cache_file, source_fs, uri, check_file = not extracted):
+                    entry["last_used"] = time.time()
+                else:
+                    # Removes the extracted files, too
+                    remove_cached_file(cache_folder, name)
+                    del manifest[name]
+                    extracted = False
+                manifest_changed = True
+
+            must_extract = is_archive and not extracted
+            is_cached = cache_fs.exists(cache_file)
+
+            if (not is_archive or must_extract) and not is_cached:
+                # Don't download the same file twice
+                if cache_file not in [d[2] for d in downloads]:
+                    downloads.append((source_fs, uri, cache_file, name))
+
+            files.append((uri, target, name, cache_file, zip_folder, must_extract))
+
+        def download(source_fs, uri, cache_file, name):
+            remote = get_remote_info(source_fs, uri) if managed else {}
+            sha256 = download_file(source_fs, uri, cache_fs, cache_file, remote)
+            if managed:
+                manifest[name] = create_entry(uri, cache_file, sha256, remote)
+
+        with self.profile.stage("download"):
+            if jobs > 1 and len(downloads) > 1:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    futures = [executor.submit(download, *d) for d in downloads]
+                    for future in futures:
+                        future.result()
+            else:
+                for d in downloads:
+                    download(*d)
 
-            if (not is_archive or must_extract) and not cache_fs.exists(cache_file):
-                with cache_fs.open(cache_file, mode='wb') as file:
-                    stream_file(source_fs, uri, file)
+        if len(downloads) > 0:
+            manifest_changed = True
 
+        paths = []
+        for uri, target, name, cache_file, zip_folder, must_extract in files:
             if must_extract:
-                if zipfile.is_zipfile(cache_file):
-                    try:
-                        with zipfile.ZipFile(cache_file, 'r') as zip_file:
-                            zip_file.extractall(zip_folder)
-                    except NotImplementedError as e:
-                        if str(e) != "That compression method is not supported":
-                            raise
-                        import zipfile_deflate64
-                        with zipfile_deflate64.ZipFile(cache_file, 'r') as zip_file:
-                            zip_file.extractall(zip_folder)
-                elif py7zr.is_7zfile(cache_file):
-                    with py7zr.SevenZipFile(cache_file, 'r') as sz_file:
-                        sz_file.extractall(zip_folder)
-                elif name.endswith(".rar"):
-                    with rarfile.RarFile(cache_file, 'r') as w:
-                        w.extractall(zip_folder)
-                else:
-                    raise ValueError(f"Only ZIP and 7Z files are supported for extraction: {cache_file}")
+                # Read ZIP files in place through GDAL if possible, which avoids extracting them to disk
+                vsizip_paths = get_vsizip_paths(cache_file, target)
+                if vsizip_paths is not None:
+                    paths.extend((path, uri) for path in vsizip_paths)
+                    continue
 
-            if is_archive:
+                with self.profile.stage("extract"):
+                    extract(cache_file, target, zip_folder, jobs)
+
+            if isinstance(target, list):
                 for filename in target:
                     paths.append((os.path.join(zip_folder, filename), uri))
             else:
                 paths.append((cache_file, uri))
 
+        if managed and cache_max_size is not None:
+            removed = evict(cache_folder, manifest, cache_max_size, keep=[f[2] for f in files])
+            if len(removed) > 0:
+                log(f"Removed {len(removed)} least recently used file(s) from the cache: {', '.join(removed)}")
+                manifest_changed = True
+
+        if manifest_changed:
+            save_manifest(cache_folder, manifest)
+
         return paths
 
     def get_urls(self):
@@ -273,40 +515,173 @@ class BaseConverter:
                 raise ValueError(f"Unknown year '{self.year}', choose from {opts}")
         return urls
 
-    def read_data(self, paths, **kwargs):
-        gdfs = []
+    def read_data(self, paths, jobs=1, **kwargs):
+        """
+        Read the files (and their layers) into a GeoDataFrame.
+
+        If jobs > 1, multiple files or layers are read in up to the given number of processes, which also run the
+        per-file migration. The processes return Arrow tables, which are concatenated without copying the data.
+        """
+        tasks = self.get_read_tasks(paths)
+        context = self.get_reader_context() if jobs > 1 and len(tasks) > 1 else None
+        if context is None:
+            return pd.concat([self.read_layer(path, uri, layer, **kwargs) for path, uri, layer in tasks])
+
+        global reader_converter
+        reader_converter = self
+        try:
+            # Converters that can't be pickled are inherited by forked processes
+            converter = self if context.get_start_method() != "fork" else None
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), mp_context=context,
+                                     initializer=init_reader, initargs=(converter,)) as executor:
+                futures = [executor.submit(read_layer_in_worker, path, uri, layer, kwargs) for path, uri, layer in tasks]
+                results = []
+                for future in futures:
+                    result, messages = future.result()
+                    replay_log(messages)
+                    results.append(result)
+        finally:
+            reader_converter = None
+
+        return concat_tables(results)
+
+    def get_read_tasks(self, paths):
+        """Returns the path, URI and layer for each file or layer that must be read"""
+        tasks = []
         for path, uri in paths:
             log(f"Reading {path} into GeoDataFrame(s)")
-            is_parquet = path.endswith(".parquet") or path.endswith(".geoparquet")
-            is_json = path.endswith(".json") or path.endswith(".geojson")
             layers = [None]
             # Parquet doesn't support layers
-            if not is_parquet:
+            if not is_parquet(path):
                 all_layers = gpd.list_layers(path)
                 layers = [layer for layer in all_layers["name"] if self.layer_filter(str(layer), path)]
                 if len(layers) == 0:
                     log(f"No layers left for layering after filtering", "warning")
 
             for layer in layers:
-                if layer is not None:
-                    kwargs["layer"] = layer
-                    log(f"- Reading layer {layer} into GeoDataFrame")
-
-                if is_parquet:
-                    data = gpd.read_parquet(path, **kwargs)
-                elif is_json:
-                    data = read_geojson(path, **kwargs)
-                else:
-                    data = gpd.read_file(path, **kwargs)
+                tasks.append((path, uri, layer))
+
+        return tasks
+
+    def read_chunks(self, paths, chunk_size, **kwargs):
+        """
+        Read the files (and their layers) in chunks of up to chunk_size rows and run the per-file migration on each chunk.
+
+        GDAL sources are streamed through Arrow and GeoParquet files are read by record batches.
+        Other files (e.g. GeoJSON) are read completely and then split into chunks.
+        """
+        for path, uri, layer in self.get_read_tasks(paths):
+            if layer is not None:
+                log(f"- Reading layer {layer} in chunks of {chunk_size} rows")
+
+            offset = 0
+            for data in self.read_layer_chunks(path, layer, chunk_size, **kwargs):
+                # Continue the index across the chunks of a file, as if the file had been read at once
+                # (unless the index has been read from the file, e.g. the FIDs)
+                if data.index.name is None:
+                    data.index = pd.RangeIndex(offset, offset + len(data))
+                offset += len(data)
 
-                # 0. Run migration per file/layer
                 data = self.file_migration(data, path, uri, layer)
                 if not isinstance(data, gpd.GeoDataFrame):
                     raise ValueError("Per-file/layer migration function must return a GeoDataFrame")
 
-                gdfs.append(data)
+                yield data
+
+    def read_layer_chunks(self, path, layer, chunk_size, **kwargs):
+        if is_parquet(path):
+            file = pq.ParquetFile(path)
+            for batch in file.iter_batches(batch_size=chunk_size, columns=kwargs.get("columns")):
+                table = pa.Table.from_batches([batch]).replace_schema_metadata(file.schema_arrow.metadata)
+                yield _arrow_to_geopandas(table)
+        elif is_json(path) or not use_arrow():
+            if not is_json(path):
+                log("Streaming requires pyogrio and GDAL 3.6 or later, reading the file at once", "warning")
+            data = self.read_source(path, layer, **kwargs)
+            for i in range(0, max(len(data), 1), chunk_size):
+                yield data.iloc[i:i + chunk_size]
+        else:
+            import pyogrio
+            read_columns = self.get_read_columns()
+            if read_columns is not None:
+                kwargs.setdefault("columns", read_columns)
+            fid_as_index = kwargs.pop("fid_as_index", False)
+            with pyogrio.open_arrow(path, layer=layer, batch_size=chunk_size, use_pyarrow=True, return_fids=fid_as_index, **kwargs) as (meta, reader):
+                geometry = meta["geometry_name"] or "wkb_geometry"
+                for batch in reader:
+                    table = pa.Table.from_batches([batch])
+                    df = table.drop_columns([geometry]).to_pandas() if geometry in table.column_names else table.to_pandas()
+                    if fid_as_index:
+                        df = df.set_index(meta["fid_column"])
+                        df.index.names = ["fid"]
+                    if geometry not in table.column_names:
+                        yield gpd.GeoDataFrame(df)
+                        continue
+
+                    geometries = gpd.GeoSeries.from_wkb(table.column(geometry).to_numpy(zero_copy_only=False), crs=meta["crs"])
+                    yield gpd.GeoDataFrame(df, geometry=geometries.set_axis(df.index))
+
+    def read_layer(self, path, uri, layer=None, **kwargs):
+        """Read a file or a layer of a file into a GeoDataFrame and run the per-file migration"""
+        if layer is not None:
+            log(f"- Reading layer {layer} into GeoDataFrame")
+
+        data = self.read_source(path, layer, **kwargs)
+
+        # 0. Run migration per file/layer
+        data = self.file_migration(data, path, uri, layer)
+        if not isinstance(data, gpd.GeoDataFrame):
+            raise ValueError("Per-file/layer migration function must return a GeoDataFrame")
+
+        return data
+
+    def read_source(self, path, layer=None, **kwargs):
+        if layer is not None:
+            kwargs["layer"] = layer
+
+        if is_parquet(path):
+            return gpd.read_parquet(path, **kwargs)
+        elif is_json(path):
+            return read_geojson(path, **kwargs)
+        else:
+            read_columns = self.get_read_columns()
+            if read_columns is not None:
+                kwargs.setdefault("columns", read_columns)
+            if use_arrow():
+                kwargs.setdefault("use_arrow", True)
+            return gpd.read_file(path, **kwargs)
+
+    def get_read_columns(self):
+        """
+        Returns the columns to read from GDAL sources, or None to read all columns.
 
-        return pd.concat(gdfs)
+        These are the columns that are mapped, filtered or migrated, so that other columns are never decoded.
+        Custom migrations (migrate, file_migration, post_migrate) may use any column, so for converters with
+        custom migrations all columns are read unless the additional columns are listed in read_columns.
+        """
+        custom = any(
+            key in self.__dict__ or getattr(type(self), key) is not getattr(BaseConverter, key)
+            for key in ("migrate", "file_migration", "post_migrate")
+        )
+        if custom and self.read_columns is None:
+            return None
+
+        return sorted(set(self.columns) | set(self.column_filters) | set(self.column_migrations) | set(self.read_columns or []))
+
+    def get_reader_context(self):
+        """
+        Returns the multiprocessing context to read files in parallel, or None if they must be read sequentially.
+
+        Converters that can't be pickled (e.g. with lambdas as filters) can only be used by forked processes.
+        """
+        try:
+            pickle.dumps(self)
+            return multiprocessing.get_context()
+        except Exception:
+            if "fork" in multiprocessing.get_all_start_methods():
+                return multiprocessing.get_context("fork")
+            log("Converter can't be sent to other processes, reading files sequentially", "warning")
+            return None
 
     def filter_rows(self, gdf):
         if len(self.column_filters) > 0:
@@ -418,79 +793,69 @@ class BaseConverter:
 
         return collection
 
-    def convert(self, output_file, cache=None, input_files=None, source_coop_url=None, store_collection=False, year=None, compression=None, geoparquet1=False, mapping_file=None, original_geometries=False, **kwargs):
-        columns = self.columns.copy()
-        self.year = year
-        """
-        Converts a field boundary datasets to fiboa.
+    def process_data(self, gdf, columns, original_geometries=False, verbose=False, jobs=1, stats=None):
         """
-        if self.bbox is not None and len(self.bbox) != 4:
-            raise ValueError("If provided, the bounding box must consist of 4 numbers")
-
-        # Create output folder if it doesn't exist
-        directory = os.path.dirname(output_file)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
-
-        urls = self.get_urls()
-        if input_files is not None and isinstance(input_files, dict) and len(input_files) > 0:
-            log("Using user provided input file(s) instead of the pre-defined file(s)", "warning")
-            urls = input_files
-        elif urls is None:
-            raise ValueError("No input files provided")
-
-        log("Getting file(s) if not cached yet")
-        paths = self.download_files(urls, cache)
-
-        gdf = self.read_data(paths, **kwargs)
-
-        log("GeoDataFrame created from source(s):")
-        # Make it so that everything is shown, don't output ... if there are too many columns or rows
-        pd.set_option('display.max_columns', None)
-        pd.set_option('display.max_rows', None)
-        print(gdf.head())
+        Runs the migrations and filters, fixes the geometries and renames the columns (steps 1 to 7 in convert).
 
+        Shows a preview of the data if it has been changed by the migrations and verbose is True.
+        Geometries are fixed in up to the given number of threads. The numbers of repaired and exploded geometries
+        are logged, or added to stats if a dict is given.
+        Returns the migrated GeoDataFrame and the mapping from the source columns to the fiboa columns.
+        """
+        columns = columns.copy()
         if self.index_as_id:
             gdf["id"] = gdf.index
 
-        hash_before = hash_df(gdf)
+        fingerprint_before = fingerprint(gdf) if verbose else None
         # 1. Run global migration
         log("Applying global migrations")
-        gdf = self.migrate(gdf)
-        assert isinstance(gdf, gpd.GeoDataFrame), "Migration function must return a GeoDataFrame"
+        with self.profile.stage("migrate", len(gdf)) as stage:
+            gdf = self.migrate(gdf)
+            assert isinstance(gdf, gpd.GeoDataFrame), "Migration function must return a GeoDataFrame"
+            stage["rows_out"] = len(gdf)
 
         # 2. Run filters to remove rows that shall not be in the final data
-        gdf = self.filter_rows(gdf)
+        with self.profile.stage("filter_rows", len(gdf)) as stage:
+            gdf = self.filter_rows(gdf)
+            stage["rows_out"] = len(gdf)
 
         # 3. Add constant columns
         if self.column_additions:
             log("Adding columns")
-            for key, value in self.column_additions.items():
-                gdf[key] = value
-                columns[key] = key
+            with self.profile.stage("column_additions", len(gdf)) as stage:
+                for key, value in self.column_additions.items():
+                    gdf[key] = value
+                    columns[key] = key
+                stage["rows_out"] = len(gdf)
 
         # 4. Run column migrations
         if self.column_migrations:
             log("Applying column migrations")
-            for key, fn in self.column_migrations.items():
-                if key in gdf.columns:
-                    gdf[key] = fn(gdf[key])
-                else:
-                    log(f"Column '{key}' not found in dataset, skipping migration", "warning")
+            with self.profile.stage("column_migrations", len(gdf)) as stage:
+                for key, fn in self.column_migrations.items():
+                    if key in gdf.columns:
+                        gdf[key] = fn(gdf[key])
+                    else:
+                        log(f"Column '{key}' not found in dataset, skipping migration", "warning")
+                stage["rows_out"] = len(gdf)
 
         # 4b. For geometry column, fix geometries
         if not original_geometries:
-            gdf.geometry = gdf.geometry.make_valid()
-            gdf = gdf.explode()
-            if gdf.geometry.array.has_z.any():
-                log("Removing Z geometry dimension", "info")
-                gdf.geometry = gdf.geometry.force_2d()
+            with self.profile.stage("fix_geometries", len(gdf)) as stage:
+                gdf, geometry_stats = fix_geometries(gdf, jobs)
+                stage["rows_out"] = len(gdf)
+            if stats is None:
+                log_geometry_stats(geometry_stats)
+            else:
+                for key, value in geometry_stats.items():
+                    stats[key] = stats.get(key, 0) + value
 
-        gdf = self.post_migrate(gdf)
+        with self.profile.stage("post_migrate", len(gdf)) as stage:
+            gdf = self.post_migrate(gdf)
+            stage["rows_out"] = len(gdf)
 
-        if hash_before != hash_df(gdf):
-            log("GeoDataFrame after migrations and filters:")
-            print(gdf.head())
+        if verbose and fingerprint_before != fingerprint(gdf):
+            preview(gdf, "GeoDataFrame after migrations and filters:")
 
         # 5. Duplicate columns if needed
         actual_columns = {}
@@ -518,30 +883,159 @@ class BaseConverter:
         drop_columns = list(set(gdf.columns) - set(actual_columns.values()))
         gdf.drop(columns = drop_columns, inplace = True)
 
-        log("GeoDataFrame fully migrated:")
-        print(gdf.head())
+        return gdf, actual_columns
 
-        collection = self.create_collection(gdf, source_coop_url=source_coop_url)
+    def convert_chunks(self, paths, output_file, column_map, chunk_size, config, source_coop_url=None, compression=None, geoparquet1=False, original_geometries=False, jobs=1, verbose=False, **kwargs):
+        """
+        Converts the data in chunks of up to chunk_size rows, which are read, migrated and written one after another.
+
+        Only one chunk is kept in memory, so the migrations must work on parts of the data.
+        The extent for the collection is computed incrementally.
+        Returns the collection, the number of rows and the fields of the Parquet file.
+        """
+        writer = None
+        crs = None
+        bounds = None
+        dates = []
+        has_dates = False
+        messages_seen = set()
+        geometry_stats = {}
+        for gdf in self.profile.iterate("read", self.read_chunks(paths, chunk_size, **kwargs)):
+            if writer is None and verbose:
+                preview(gdf, "GeoDataFrame created from source(s) (first chunk):")
+
+            # Show the messages of the migrations only once, not for every chunk
+            (gdf, actual_columns), messages = run_with_log_buffer(self.process_data, gdf, column_map, original_geometries, False, jobs, geometry_stats)
+            replay_log([m for m in messages if (m[0], m[1]) not in messages_seen])
+            messages_seen.update((m[0], m[1]) for m in messages)
+
+            if writer is None:
+                if verbose:
+                    preview(gdf, "GeoDataFrame fully migrated (first chunk):")
+
+                log("Creating GeoParquet file: " + output_file)
+                writer = ChunkedParquetWriter(output_file, list(actual_columns.values()), {"fiboa_extensions": list(self.extensions)},
+                                              config, self.missing_schemas, compression, geoparquet1)
+                crs = gdf.crs
+            elif gdf.crs != crs:
+                gdf = gdf.to_crs(crs)
+
+            if len(gdf) > 0:
+                b = gdf.total_bounds
+                bounds = b if bounds is None else [min(bounds[0], b[0]), min(bounds[1], b[1]), max(bounds[2], b[2]), max(bounds[3], b[3])]
+            if "determination_datetime" in gdf.columns:
+                has_dates = True
+                chunk_dates = pd.to_datetime(gdf["determination_datetime"]).dropna()
+                if len(chunk_dates) > 0:
+                    dates = [min(dates + [chunk_dates.min()]), max(dates + [chunk_dates.max()])]
+
+            with self.profile.stage("create_parquet", len(gdf)) as stage:
+                writer.write(gdf)
+                stage["rows_out"] = len(gdf)
+            log(f"Converted {writer.rows} rows")
+
+        if writer is None:
+            raise ValueError("No data found in the source file(s)")
+
+        log_geometry_stats(geometry_stats)
+
+        # Create the collection from a GeoDataFrame that has the extent of all chunks
+        summary = {}
+        if has_dates:
+            summary["determination_datetime"] = dates if len(dates) > 0 else [None]
+        length = max(len(dates), 1)
+        geometry = [box(*bounds)] * length if bounds is not None else [None] * length
+        with self.profile.stage("create_collection"):
+            collection = self.create_collection(gpd.GeoDataFrame(summary, geometry=geometry, crs=crs), source_coop_url=source_coop_url)
+
+        with self.profile.stage("create_parquet"):
+            pq_fields = writer.close(collection)
+        return collection, writer.rows, pq_fields
+
+    def convert(self, output_file, cache=None, input_files=None, source_coop_url=None, store_collection=False, year=None, compression=None, geoparquet1=False, mapping_file=None, original_geometries=False, jobs=1, cache_max_size=None, chunk_size=None, verbose=False, profile_file=None, **kwargs):
+        """
+        Converts a field boundary datasets to fiboa.
+
+        The wall time, CPU time, peak memory and rows per stage are logged as a table if verbose is True
+        or a profile file is given, which the statistics are written to as JSON.
+        """
+        columns = self.columns.copy()
+        self.year = year
+        self.profile = Profile(self.id, year=year, jobs=jobs, chunk_size=chunk_size, original_geometries=original_geometries)
+        if self.bbox is not None and len(self.bbox) != 4:
+            raise ValueError("If provided, the bounding box must consist of 4 numbers")
+
+        # Create output folder if it doesn't exist
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        urls = self.get_urls()
+        if input_files is not None and isinstance(input_files, dict) and len(input_files) > 0:
+            log("Using user provided input file(s) instead of the pre-defined file(s)", "warning")
+            urls = input_files
+        elif urls is None:
+            raise ValueError("No input files provided")
+
+        log("Getting file(s) if not cached yet")
+        paths = self.download_files(urls, cache, jobs, cache_max_size)
+
+        if verbose:
+            # Make it so that everything is shown, don't output ... if there are too many columns or rows
+            pd.set_option('display.max_columns', None)
+            pd.set_option('display.max_rows', None)
 
-        log("Creating GeoParquet file: " + output_file)
         config = {"fiboa_version": fiboa_version}
-        columns = list(actual_columns.values())
-        pq_fields = create_parquet(gdf, columns, collection, output_file, config, self.missing_schemas, compression, geoparquet1)
+        if chunk_size is None:
+            with self.profile.stage("read") as stage:
+                gdf = self.read_data(paths, jobs, **kwargs)
+                stage["rows_out"] = len(gdf)
+            if verbose:
+                preview(gdf, "GeoDataFrame created from source(s):")
+
+            gdf, actual_columns = self.process_data(gdf, columns, original_geometries, verbose, jobs)
+            if verbose:
+                preview(gdf, "GeoDataFrame fully migrated:")
+
+            with self.profile.stage("create_collection"):
+                collection = self.create_collection(gdf, source_coop_url=source_coop_url)
+
+            log("Creating GeoParquet file: " + output_file)
+            columns = list(actual_columns.values())
+            with self.profile.stage("create_parquet", len(gdf)) as stage:
+                pq_fields = create_parquet(gdf, columns, collection, output_file, config, self.missing_schemas, compression, geoparquet1)
+                stage["rows_out"] = len(gdf)
+            rows = len(gdf)
+        else:
+            collection, rows, pq_fields = self.convert_chunks(
+                paths, output_file, columns, chunk_size, config, source_coop_url, compression, geoparquet1, original_geometries, jobs, verbose, **kwargs
+            )
+
         if store_collection:
-            external_collection = add_asset_to_collection(collection, output_file, rows = len(gdf), columns = pq_fields)
+            external_collection = add_asset_to_collection(collection, output_file, rows = rows, columns = pq_fields)
             collection_file = os.path.join(os.path.dirname(output_file), "collection.json")
             log("Creating Collection file: " + collection_file)
             with open(collection_file, "w") as f:
                 json.dump(external_collection, f, indent=2)
 
+        self.profile.finish()
+        if verbose or profile_file:
+            self.profile.log_summary(log)
+        if profile_file:
+            log("Writing profile: " + profile_file)
+            write_profile(profile_file, self.profile)
+
         log("Finished", "success")
 
     def __call__(self, *args, **kwargs):
         self.convert(*args, **kwargs)
 
 
-def hash_df(df):
-    # dataframe is unhashable, simple way to
-    buf = StringIO()
-    df.info(buf=buf)
-    return hash(buf.getvalue())
+def fingerprint(df):
+    """A cheap fingerprint to detect changes of a DataFrame: the columns, their types and the number of rows"""
+    return tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), len(df)
+
+
+def preview(df, title):
+    log(title)
+    print(df.head())
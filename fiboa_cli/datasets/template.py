@@ -114,6 +114,11 @@ class TemplateConverter(BaseConverter):  # change this class name to your use ca
     # def file_migration(self, gdf: gpd.GeoDataFrame, path: str, uri: str, layer: str = None) -> gpd.GeoDataFrame:
     #     return data
 
+    # Only the columns that are mapped, filtered or migrated are read from the source files.
+    # If you override migrate or file_migration, all columns are read, unless you list the additional
+    # columns that your migrations need here, e.g. {"crop_code"}.
+    # read_columns = set()
+
     # Schemas for the fields that are not defined in fiboa
     # Keys must be the values from the COLUMNS dict, not the keys
     missing_schemas = {
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from .util import log
+
+# The manifest is stored in the cache folder and describes the downloaded files
+MANIFEST_FILE = "manifest.json"
+
+
+class HashingWriter:
+    """Wraps a file to compute the SHA-256 checksum of the data while it's written"""
+
+    def __init__(self, file, sha256 = None):
+        self.file = file
+        self.sha256 = sha256 if sha256 is not None else hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+
+def hash_file(path, sha256 = None, chunk_size = 10 * 1024 * 1024):
+    """Computes the SHA-256 checksum of a file, continues the given hash object if provided"""
+    if sha256 is None:
+        sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256
+
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def get_remote_info(fs, uri):
+    """Returns the size, ETag and last modification date of a remote file, as far as the server provides them"""
+    try:
+        info = fs.info(uri)
+    except Exception:
+        return {}
+
+    last_modified = info.get("Last-Modified") or info.get("LastModified") or info.get("updated") or info.get("mtime")
+    return {
+        "size": info.get("size"),
+        "etag": info.get("ETag") or info.get("etag"),
+        "last_modified": str(last_modified) if last_modified is not None else None,
+    }
+
+
+def create_entry(uri, path, sha256, remote):
+    stat = os.stat(path)
+    now = time.time()
+    return {
+        "url": uri,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": sha256,
+        "etag": remote.get("etag"),
+        "last_modified": remote.get("last_modified"),
+        "downloaded": now,
+        "last_used": now,
+    }
+
+
+def is_valid(entry, path, fs, uri, check_file = True):
+    """
+    Checks whether a cached file can be reused.
+
+    The file must be complete (size), unchanged since the download (checksum, only computed if the file
+    was modified) and the remote file must not have changed (size, ETag, Last-Modified).
+    The checks for the file can be disabled, e.g. if only the files extracted from an archive are kept.
+    If the server can't be reached, the cached file is used.
+    """
+    if entry.get("url") != uri:
+        return False
+
+    if check_file:
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry.get("size"):
+            log(f"Cached file {path} is incomplete or corrupted, downloading again", "warning")
+            return False
+        if stat.st_mtime != entry.get("mtime") and hash_file(path).hexdigest() != entry.get("sha256"):
+            log(f"Cached file {path} was modified, downloading again", "warning")
+            return False
+
+    remote = get_remote_info(fs, uri)
+    for key in ("size", "etag", "last_modified"):
+        cached = entry.get(key)
+        if remote.get(key) is not None and cached is not None and remote.get(key) != cached:
+            log(f"Source {uri} has changed, downloading again", "warning")
+            return False
+
+    return True
+
+
+def remove(folder, name):
+    """Removes a file and the folder with its extracted files from the cache"""
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        os.remove(path)
+    extracted = os.path.join(folder, "extracted." + os.path.splitext(name)[0])
+    if os.path.isdir(extracted):
+        shutil.rmtree(extracted)
+
+
+def get_size(folder, name):
+    """Returns the size of a cached file including its extracted files"""
+    size = 0
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        size += os.path.getsize(path)
+    extracted = os.path.join(folder, "extracted." + os.path.splitext(name)[0])
+    for root, _, files in os.walk(extracted):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size
+
+
+def evict(folder, manifest, max_size, keep = []):
+    """
+    Removes the least recently used files from the cache until the cache is smaller than max_size bytes.
+
+    Files that are not listed in the manifest and the files with the names in keep are never removed.
+    Returns the names of the removed files.
+    """
+    sizes = {name: get_size(folder, name) for name in manifest}
+    total = sum(sizes.values())
+    removed = []
+    for name in sorted(manifest, key = lambda n: manifest[n].get("last_used", 0)):
+        if total <= max_size:
+            break
+        if name in keep:
+            continue
+        remove(folder, name)
+        total -= sizes[name]
+        removed.append(name)
+        del manifest[name]
+
+    return removed
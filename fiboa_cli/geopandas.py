@@ -56,9 +56,9 @@ def _geopandas_to_arrow(
 
     # Store geopandas specific file-level metadata
     # This must be done AFTER creating the table or it is not persisted
-    metadata = table.schema.metadata
+    metadata = table.schema.metadata or {}
     metadata.update({b"geo": _encode_metadata(geo_metadata)})
-    if schema:
+    if schema and schema.metadata:
         metadata.update(schema.metadata)
 
     return table.replace_schema_metadata(metadata)
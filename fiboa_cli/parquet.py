@@ -1,16 +1,137 @@
 import json
 import pyarrow as pa
+import pyarrow.parquet as pq
 
 from geopandas import GeoDataFrame
 from shapely.geometry import shape
 
 from .types import get_geopandas_dtype, get_pyarrow_type_for_geopandas, get_pyarrow_field
 from .util import log, load_fiboa_schema, load_file, merge_schemas, is_schema_empty
-from .geopandas import to_parquet
+from .geopandas import _geopandas_to_arrow, to_parquet
 
 ROW_GROUP_SIZE = 25000
 
 def create_parquet(data, columns, collection, output_file, config, missing_schemas = {}, compression = None, geoparquet1 = False):
+    schemas, collection = load_schemas(collection, config, missing_schemas)
+    data = prepare_dataframe(data, columns, schemas)
+    pq_fields = get_parquet_fields(data, columns, schemas)
+
+    # Define the schema for the Parquet file
+    pq_schema = pa.schema(pq_fields)
+    pq_schema = pq_schema.with_metadata({"fiboa": json.dumps(collection).encode("utf-8")})
+
+    if compression is None:
+        compression = "brotli"
+
+    # Write the data to the Parquet file
+    to_parquet(
+        data,
+        output_file,
+        schema = pq_schema,
+        index = False,
+        coerce_timestamps = "ms",
+        compression = compression,
+        schema_version = "1.0.0" if geoparquet1 else "1.1.0",
+        row_group_size = ROW_GROUP_SIZE,
+        write_covering_bbox = False if geoparquet1 else True
+    )
+
+    return pq_fields
+
+
+class ChunkedParquetWriter:
+    """
+    Writes GeoDataFrames chunk by chunk to a GeoParquet file, so that the data doesn't need to fit into memory.
+
+    The GeoParquet metadata (bounding box and geometry types) is computed incrementally.
+    As it and the collection depend on all chunks, the metadata is added to the file when it's closed.
+    """
+
+    def __init__(self, output_file, columns, collection, config, missing_schemas = {}, compression = None, geoparquet1 = False):
+        self.output_file = output_file
+        self.columns = columns
+        self.missing_schemas = missing_schemas
+        self.compression = compression if compression is not None else "brotli"
+        self.geoparquet1 = geoparquet1
+        self.schemas, _ = load_schemas(collection, config, missing_schemas)
+        self.pq_fields = None
+        self.pq_schema = None
+        self.writer = None
+        self.geo_metadata = None
+        self.rows = 0
+
+    def write(self, data):
+        data = prepare_dataframe(data, self.columns, self.schemas)
+        if self.writer is not None and len(data) == 0:
+            return
+
+        if self.pq_schema is None:
+            self.pq_fields = get_parquet_fields(data, self.columns, self.schemas)
+            self.pq_schema = pa.schema(self.pq_fields)
+        else:
+            # Columns that are missing in this chunk, e.g. in one of multiple source files
+            for field in self.pq_schema:
+                if field.name not in data.columns:
+                    data[field.name] = None
+
+        table = _geopandas_to_arrow(
+            data,
+            index = False,
+            schema_version = "1.0.0" if self.geoparquet1 else "1.1.0",
+            write_covering_bbox = False if self.geoparquet1 else True,
+            schema = self.pq_schema
+        )
+        self.merge_geo_metadata(json.loads(table.schema.metadata[b"geo"]), len(data) > 0)
+        table = table.replace_schema_metadata(None)
+
+        if self.writer is None:
+            # The Arrow schema would take precedence over the metadata added on close, so don't store it
+            self.writer = pq.ParquetWriter(
+                self.output_file, table.schema, compression = self.compression, coerce_timestamps = "ms", store_schema = False
+            )
+        self.writer.write_table(table, row_group_size = ROW_GROUP_SIZE)
+        self.rows += len(data)
+
+    def merge_geo_metadata(self, geo, has_data):
+        if self.geo_metadata is None:
+            self.geo_metadata = geo
+            if not has_data:
+                for column in geo["columns"].values():
+                    column.pop("bbox", None)
+            return
+        if not has_data:
+            return
+
+        for name, column in geo["columns"].items():
+            merged = self.geo_metadata["columns"][name]
+            merged["geometry_types"] = sorted(set(merged.get("geometry_types", [])) | set(column.get("geometry_types", [])))
+            if "bbox" not in column:
+                continue
+            elif "bbox" not in merged:
+                merged["bbox"] = column["bbox"]
+            else:
+                a, b = merged["bbox"], column["bbox"]
+                merged["bbox"] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+    def close(self, collection):
+        """Adds the metadata with the given collection and closes the file, returns the fields of the Parquet file"""
+        if self.writer is None:
+            raise ValueError("No data has been written")
+
+        if not is_schema_empty(self.missing_schemas):
+            collection = collection.copy()
+            collection["fiboa_custom_schemas"] = self.missing_schemas
+
+        self.writer.add_key_value_metadata({
+            "geo": json.dumps(self.geo_metadata),
+            "fiboa": json.dumps(collection),
+        })
+        self.writer.close()
+        return self.pq_fields
+
+
+def load_schemas(collection, config, missing_schemas = {}):
+    """Loads and merges the fiboa schema, the extension schemas and the custom schemas, returns them and the collection"""
     # Load the data schema
     fiboa_schema = load_fiboa_schema(config)
     schemas = merge_schemas(missing_schemas, fiboa_schema)
@@ -31,11 +152,15 @@ def create_parquet(data, columns, collection, output_file, config, missing_schem
                     log(f"Redirecting {ext} to {path}", "info")
                 else:
                     path = ext
-                extensions[ext] = load_file(path)
+                extensions[ext] = load_file(path, persistent_cache = True)
                 schemas = merge_schemas(schemas, extensions[ext])
             except Exception as e:
                 log(f"Extension schema for {ext} can't be loaded: {e}", "warning")
 
+    return schemas, collection
+
+
+def prepare_dataframe(data, columns, schemas):
     # Create GeoDataFrame from the features
     if not isinstance(data, GeoDataFrame):
         data = features_to_dataframe(data, columns)
@@ -48,6 +173,10 @@ def create_parquet(data, columns, collection, output_file, config, missing_schem
     if len(duplicates):
         raise ValueError(f"Columns are defined multiple times: {duplicates}")
 
+    return data
+
+
+def get_parquet_fields(data, columns, schemas):
     # Define the fields for the schema
     pq_fields = []
     for name in columns:
@@ -80,26 +209,6 @@ def create_parquet(data, columns, collection, output_file, config, missing_schem
         else:
             pq_fields.append(field)
 
-    # Define the schema for the Parquet file
-    pq_schema = pa.schema(pq_fields)
-    pq_schema = pq_schema.with_metadata({"fiboa": json.dumps(collection).encode("utf-8")})
-
-    if compression is None:
-        compression = "brotli"
-
-    # Write the data to the Parquet file
-    to_parquet(
-        data,
-        output_file,
-        schema = pq_schema,
-        index = False,
-        coerce_timestamps = "ms",
-        compression = compression,
-        schema_version = "1.0.0" if geoparquet1 else "1.1.0",
-        row_group_size = ROW_GROUP_SIZE,
-        write_covering_bbox = False if geoparquet1 else True
-    )
-
     return pq_fields
 
 
@@ -0,0 +1,171 @@
+import json
+import sys
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .version import __version__
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Columns of the summary table: key, title and format
+TABLE_COLUMNS = [
+    ("wall_time", "Wall (s)", "{:.3f}"),
+    ("cpu_time", "CPU (s)", "{:.3f}"),
+    ("peak_rss", "Peak RSS (MB)", "{:.1f}"),
+    ("rows_in", "Rows in", "{}"),
+    ("rows_out", "Rows out", "{}"),
+]
+
+
+def get_cpu_time():
+    """CPU time of the process and its terminated child processes (e.g. the workers that read files) in seconds"""
+    cpu_time = time.process_time()
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time += usage.ru_utime + usage.ru_stime
+    return cpu_time
+
+
+def get_peak_rss():
+    """Peak resident set size of the process in bytes, None if not available"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def reset_peak_rss():
+    """Resets the peak resident set size of the process, only supported on Linux. Returns whether it was reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class Profile:
+    """
+    Collects the wall time, CPU time, peak memory and number of rows per stage of a conversion.
+
+    Stages that run multiple times, e.g. once per chunk, are summed up.
+    The peak memory is measured per stage on Linux, on other systems it's the peak of the process up to the end
+    of the stage.
+    """
+
+    def __init__(self, dataset = None, **settings):
+        self.dataset = dataset
+        # Parameters of the conversion that affect the timings, e.g. the number of jobs
+        self.settings = settings
+        self.stages = {}
+        self.start_wall = time.perf_counter()
+        self.start_cpu = get_cpu_time()
+        self.end_wall = None
+        self.end_cpu = None
+        self.peak_rss_per_stage = reset_peak_rss()
+
+    @contextmanager
+    def stage(self, name, rows = None):
+        """
+        Measures a stage of the conversion, rows is the number of rows that go into the stage.
+
+        Yields a dict in which the number of rows that come out of the stage can be set as rows_out.
+        """
+        record = {"rows_in": rows, "rows_out": None}
+        if self.peak_rss_per_stage:
+            reset_peak_rss()
+        start_wall = time.perf_counter()
+        start_cpu = get_cpu_time()
+        try:
+            yield record
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = get_cpu_time() - start_cpu
+            self.add(name, wall_time, cpu_time, get_peak_rss(), record["rows_in"], record["rows_out"])
+
+    def iterate(self, name, iterable):
+        """Measures the time to get the items from an iterable of DataFrames, e.g. chunks that are read lazily"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as record:
+                item = next(iterator, None)
+                if item is not None:
+                    record["rows_out"] = len(item)
+            if item is None:
+                return
+            yield item
+
+    def add(self, name, wall_time, cpu_time, peak_rss = None, rows_in = None, rows_out = None):
+        stats = self.stages.setdefault(name, {
+            "calls": 0, "wall_time": 0.0, "cpu_time": 0.0, "peak_rss": None, "rows_in": None, "rows_out": None
+        })
+        stats["calls"] += 1
+        stats["wall_time"] += wall_time
+        stats["cpu_time"] += cpu_time
+        if peak_rss is not None:
+            stats["peak_rss"] = max(stats["peak_rss"] or 0, peak_rss)
+        for key, value in (("rows_in", rows_in), ("rows_out", rows_out)):
+            if value is not None:
+                stats[key] = (stats[key] or 0) + value
+
+    def finish(self):
+        self.end_wall = time.perf_counter()
+        self.end_cpu = get_cpu_time()
+
+    def get_total(self):
+        end_wall = self.end_wall if self.end_wall is not None else time.perf_counter()
+        end_cpu = self.end_cpu if self.end_cpu is not None else get_cpu_time()
+        peaks = [s["peak_rss"] for s in self.stages.values() if s["peak_rss"] is not None]
+        return {
+            "wall_time": end_wall - self.start_wall,
+            "cpu_time": end_cpu - self.start_cpu,
+            "peak_rss": max(peaks) if len(peaks) > 0 else get_peak_rss(),
+            "rows_in": None,
+            "rows_out": None,
+        }
+
+    def log_summary(self, logger):
+        """Logs a table with the statistics per stage and in total"""
+        rows = [[name] + [format_value(stats, key, fmt) for key, _, fmt in TABLE_COLUMNS] for name, stats in self.stages.items()]
+        rows.append(["total"] + [format_value(self.get_total(), key, fmt) for key, _, fmt in TABLE_COLUMNS])
+        header = ["Stage"] + [title for _, title, _ in TABLE_COLUMNS]
+        widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+
+        def format_row(row):
+            return "  ".join([row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])])
+
+        logger("Profile:", "info")
+        logger(format_row(header), "info")
+        for row in rows:
+            logger(format_row(row), "info")
+
+    def to_dict(self):
+        return {
+            "dataset": self.dataset,
+            "cli_version": __version__,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "settings": self.settings,
+            "peak_rss_per_stage": self.peak_rss_per_stage,
+            "stages": [dict(stats, name = name) for name, stats in self.stages.items()],
+            "total": self.get_total(),
+        }
+
+
+def format_value(stats, key, fmt):
+    value = stats.get(key)
+    if value is None:
+        return "-"
+    if key == "peak_rss":
+        value = value / 1024 ** 2
+    return fmt.format(value)
+
+
+def write_profile(path, profile):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, indent=2)
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .validate_data import Issue, estimate_violation_rate, merge_issues
+
+# Number of issues that are printed per column, further issues are only counted
+MAX_ISSUES = 10
+
+REGEX_REQUIRED = re.compile("^'([^']+)' is a required property$")
+
+# Schema of the records that are appended to Parquet logs
+RECORD_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ms", tz = "UTC")),
+    ("file", pa.string()),
+    ("valid", pa.bool_()),
+    ("kind", pa.string()),
+    ("column", pa.string()),
+    ("rule", pa.string()),
+    ("rows", pa.int64()),
+    ("violations", pa.int64()),
+    ("bytes", pa.int64()),
+    ("seconds", pa.float64()),
+])
+
+
+class Report:
+    """
+    Collects the issues found while validating a file.
+
+    Issues are grouped per column (or per part of a GeoJSON feature) and rule,
+    each with the number of affected rows or features and a few examples.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.valid = None
+        # Number of rows that have been validated if only a sample has been validated
+        self.sampled_rows = None
+        # Number of rows per sampled row group and the number of row groups in the file
+        self.sampled_row_groups = None
+        self.total_row_groups = None
+        self.issues = {}
+        self.messages = []
+        # Number of rows (or features) checked and bytes read
+        self.rows = None
+        self.bytes_read = None
+        # Seconds spent per stage of the validation, e.g. collection or data
+        self.timings = {}
+        # Statistics per column, including the rows, violations and seconds per rule
+        self.columns = {}
+
+    @contextmanager
+    def timer(self, stage):
+        """Measures the time spent in a stage of the validation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def add_issues(self, key, issues):
+        if len(issues) > 0:
+            merge_issues(self.issues.setdefault(key, []), issues)
+
+    def add_feature_errors(self, sample, errors):
+        """Adds the JSON Schema errors of a GeoJSON feature, see describe_error for the format of the errors"""
+        for key, rule, detail, message in errors:
+            self.add_issues(key, [Issue(rule, message, 1, [sample], detail, unit = "feature")])
+
+    def has_issues(self):
+        return len(self.issues) > 0
+
+    def log_issues(self, logger, max_issues = MAX_ISSUES):
+        """Logs the issues, at most max_issues per column"""
+        for key, issues in self.issues.items():
+            for issue in issues[:max_issues]:
+                if self.sampled_row_groups:
+                    rate, low, high = estimate_violation_rate(issue.row_groups, self.sampled_row_groups, self.total_row_groups)
+                    logger(f"{key}: {issue} - estimated violation rate: {rate:.4%} (95% confidence interval: {low:.4%} to {high:.4%})", "error")
+                else:
+                    logger(f"{key}: {issue}", "error")
+
+            if len(issues) > max_issues:
+                count = sum(issue.count for issue in issues[max_issues:])
+                logger(f"{key}: {len(issues) - max_issues} more issues affecting {count} {issues[0].unit}s", "error")
+
+    def to_dict(self):
+        issues = []
+        for key, column_issues in self.issues.items():
+            for issue in column_issues:
+                issues.append({
+                    "column": key,
+                    "rule": issue.rule,
+                    "detail": issue.detail,
+                    "message": issue.message,
+                    "count": issue.count,
+                    "unit": issue.unit,
+                    "examples": issue.samples,
+                })
+
+        return {
+            "file": self.file,
+            "valid": self.valid,
+            "rows": self.rows,
+            "sampled_rows": self.sampled_rows,
+            "bytes_read": self.bytes_read,
+            "timings": self.timings,
+            "columns": self.columns,
+            "issues": issues,
+            "messages": [{"status": status, "text": text.strip()} for text, status, _ in self.messages],
+        }
+
+    def to_records(self):
+        """
+        Flattens the statistics into records with the same fields, e.g. for a Parquet log.
+
+        There's one record per stage, per column and per rule of a column.
+        """
+        base = {"file": self.file, "valid": self.valid, "column": None, "rule": None, "rows": None, "violations": None, "bytes": None}
+        records = [dict(base, kind = "file", rows = self.rows, bytes = self.bytes_read, seconds = self.timings.get("total"))]
+        for stage, seconds in self.timings.items():
+            if stage != "total":
+                records.append(dict(base, kind = "stage", rule = stage, seconds = seconds))
+        for key, stats in self.columns.items():
+            violations = sum(issue.count for issue in self.issues.get(key, []))
+            records.append(dict(base, kind = "column", column = key, rows = stats.get("rows"), violations = violations, bytes = stats.get("bytes"), seconds = stats.get("seconds")))
+            for rule, rule_stats in stats.get("rules", {}).items():
+                records.append(dict(base, kind = "rule", column = key, rule = rule, **rule_stats))
+        return records
+
+
+def write_reports(path, reports):
+    """
+    Writes the reports to a file.
+
+    For Parquet logs (*.parquet) the records are flattened and written with a timestamp to a new file per run
+    in a folder with the given name, which can be read as a single dataset (e.g. pyarrow.parquet.read_table).
+    All other files are overwritten with the reports as JSON.
+    """
+    if not path.endswith(".parquet"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([report.to_dict() for report in reports], f, indent=2)
+        return
+
+    if os.path.exists(path) and not os.path.isdir(path):
+        raise ValueError(f"Can't append to the Parquet log {path}, it must be a folder with one file per run")
+    os.makedirs(path, exist_ok = True)
+    check_log_schema(path)
+
+    timestamp = datetime.now(timezone.utc)
+    records = [dict(record, timestamp = timestamp) for report in reports for record in report.to_records()]
+    table = pa.Table.from_pylist(records, schema = RECORD_SCHEMA)
+
+    # Write to a temporary file first, files starting with a dot are not read as part of the log
+    name = f"{timestamp:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet"
+    file = os.path.join(path, name)
+    tmp = os.path.join(path, "." + name)
+    pq.write_table(table, tmp)
+    os.replace(tmp, file)
+
+
+def check_log_schema(path):
+    """Checks that the existing records of a Parquet log can be read together with new records"""
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(".parquet"):
+            continue
+        file = os.path.join(path, name)
+        try:
+            schema = pq.read_schema(file)
+            if schema.names != RECORD_SCHEMA.names:
+                raise ValueError(f"columns {', '.join(schema.names)}")
+            pa.table({f.name: pa.array([], f.type) for f in schema}).cast(RECORD_SCHEMA)
+        except (pa.ArrowException, ValueError) as e:
+            raise ValueError(f"Can't append to the Parquet log {path}, {file} has an incompatible schema: {e}")
+        # All files are written with the same schema, so checking one file is sufficient
+        return
+
+
+def describe_error(error, extension = None):
+    """
+    Converts a JSON Schema validation error for a GeoJSON feature into a tuple for Report.add_feature_errors.
+
+    The errors are grouped by the property (or the top-level member of the feature) and the rule.
+    The tuple can be sent to other processes, unlike the error.
+    """
+    path = list(error.absolute_path)
+    missing = REGEX_REQUIRED.match(error.message) if error.validator == "required" else None
+    if missing is not None and path in ([], ["properties"]):
+        key = missing.group(1)
+    elif len(path) >= 2 and path[0] == "properties":
+        key = str(path[1])
+    elif len(path) > 0:
+        key = str(path[0])
+    else:
+        key = "feature"
+
+    if extension is not None:
+        key = f"{key} (ext {extension})"
+
+    # Errors about the structure of an object are different for each property
+    detail = error.message if missing is None and error.validator in ("required", "additionalProperties", "dependentRequired") else None
+
+    return key, error.validator, detail, error.message
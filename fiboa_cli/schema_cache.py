@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import click
+import requests
+
+from .const import LOG_STATUS_COLOR
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def get_env_ttl():
+    """Read the TTL in seconds from FIBOA_CACHE_TTL, invalid values fall back to the default with a warning"""
+    value = os.environ.get("FIBOA_CACHE_TTL")
+    if not value:
+        return DEFAULT_TTL
+    try:
+        return int(value)
+    except ValueError:
+        message = f"Invalid value for FIBOA_CACHE_TTL: {value}, using the default of {DEFAULT_TTL} seconds"
+        click.echo(click.style(message, fg=LOG_STATUS_COLOR["warning"]), err=True)
+        return DEFAULT_TTL
+
+
+# Settings of the persistent schema cache, can be changed via `configure` or environment variables
+settings = {
+    "directory": os.environ.get("FIBOA_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "fiboa", "schemas"
+    ),
+    "ttl": get_env_ttl(),
+    "offline": os.environ.get("FIBOA_OFFLINE", "").lower() in ["1", "true", "yes"],
+    "enabled": os.environ.get("FIBOA_NO_CACHE", "").lower() not in ["1", "true", "yes"],
+}
+
+TIMEOUT = 30
+
+
+def configure(directory = None, ttl = None, offline = None, enabled = None):
+    """Change the settings of the schema cache, parameters that are None are not changed"""
+    for key, value in [("directory", directory), ("ttl", ttl), ("offline", offline), ("enabled", enabled)]:
+        if value is not None:
+            settings[key] = value
+
+
+def is_cacheable(uri):
+    return uri.startswith("http://") or uri.startswith("https://")
+
+
+def fetch(uri) -> bytes:
+    """
+    Fetch a remote file through the persistent cache.
+
+    Cached files are returned as-is as long as they are younger than the TTL or if the cache is offline.
+    Older files are revalidated with the server using the ETag and Last-Modified headers.
+    If the server can't be reached, a stale cached copy is used.
+    """
+    if not settings["enabled"]:
+        if settings["offline"]:
+            raise Exception(f"Can't load {uri} in offline mode without cache")
+        return download(uri)[0]
+
+    entry = read_entry(uri)
+    content = read_content(entry)
+    if content is not None:
+        if settings["offline"] or time.time() - entry["fetched"] < settings["ttl"]:
+            return content
+    elif settings["offline"]:
+        raise Exception(f"{uri} is not available in the cache (offline mode)")
+
+    headers = {}
+    if content is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        new_content, response = download(uri, headers)
+    except requests.RequestException:
+        if content is not None:
+            return content
+        raise
+
+    if new_content is None:
+        # 304 Not Modified
+        entry["fetched"] = time.time()
+        write_entry(uri, entry)
+        return content
+
+    digest = hashlib.sha256(new_content).hexdigest()
+    write_file(os.path.join(settings["directory"], "objects", digest), new_content)
+    write_entry(uri, {
+        "url": uri,
+        "sha256": digest,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched": time.time(),
+    })
+    return new_content
+
+
+def download(uri, headers = {}):
+    """Download a file, returns the content (None if not modified) and the response"""
+    response = requests.get(uri, headers = headers, timeout = TIMEOUT)
+    if response.status_code == 304:
+        return None, response
+    response.raise_for_status()
+    return response.content, response
+
+
+def store(uri, content: bytes):
+    """Add a file to the cache, e.g. to prepare the cache for offline use"""
+    digest = hashlib.sha256(content).hexdigest()
+    write_file(os.path.join(settings["directory"], "objects", digest), content)
+    write_entry(uri, {"url": uri, "sha256": digest, "etag": None, "last_modified": None, "fetched": time.time()})
+
+
+def clear():
+    """Remove all files from the cache"""
+    for folder in ["index", "objects"]:
+        path = os.path.join(settings["directory"], folder)
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+
+
+def get_entry_path(uri):
+    key = hashlib.sha256(uri.encode("utf-8")).hexdigest()
+    return os.path.join(settings["directory"], "index", f"{key}.json")
+
+
+def read_entry(uri):
+    try:
+        with open(get_entry_path(uri), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_content(entry):
+    if entry is None:
+        return None
+    try:
+        with open(os.path.join(settings["directory"], "objects", entry["sha256"]), "rb") as f:
+            content = f.read()
+    except (OSError, KeyError):
+        return None
+    # Ignore corrupted files
+    if hashlib.sha256(content).hexdigest() != entry["sha256"]:
+        return None
+    return content
+
+
+def write_entry(uri, entry):
+    write_file(get_entry_path(uri), json.dumps(entry).encode("utf-8"))
+
+
+def write_file(path, content: bytes):
+    """Write atomically so that parallel processes never read partial files"""
+    folder = os.path.dirname(path)
+    try:
+        os.makedirs(folder, exist_ok = True)
+        fd, tmp = tempfile.mkstemp(dir = folder, prefix = ".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        # The cache is an optimization only, e.g. the folder may be read-only
+        pass
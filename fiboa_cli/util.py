@@ -7,7 +7,9 @@ import pyarrow.parquet as pq
 import pandas as pd
 import re
 import referencing
+import threading
 
+from collections import OrderedDict
 from urllib.parse import urlparse
 from fsspec import AbstractFileSystem
 from fsspec.implementations.http import HTTPFileSystem
@@ -19,25 +21,65 @@ from pyarrow.fs import FSSpecHandler, PyFileSystem
 from typing import Union
 from urllib.request import Request, urlopen
 
-from .const import LOG_STATUS_COLOR, SUPPORTED_PROTOCOLS, STAC_COLLECTION_SCHEMA, GEOPARQUET_SCHEMA
+from . import schema_cache
+from .const import LOG_STATUS_COLOR, SUPPORTED_PROTOCOLS, STAC_COLLECTION_SCHEMA, GEOPARQUET_SCHEMA, GEOJSONSEQ_EXTENSIONS
 from .version import fiboa_version
 
 file_cache = {}
+# Validators of the most recently used schemas, see create_validator
+validator_cache = OrderedDict()
+validator_cache_lock = threading.Lock()
+VALIDATOR_CACHE_SIZE = 16
+log_buffer = None
 
 def log(text: str, status="info", nl = True):
     """Log a message with a severity level (which leads to different colors)"""
-    click.echo(click.style(text, fg=LOG_STATUS_COLOR[status]), nl=nl)
+    if log_buffer is not None:
+        log_buffer.append((text, status, nl))
+    else:
+        click.echo(click.style(text, fg=LOG_STATUS_COLOR[status]), nl=nl)
+
+
+def run_with_log_buffer(fn, *args, **kwargs):
+    """Run a function and buffer its log messages instead of printing them, returns the result and the messages"""
+    global log_buffer
+    log_buffer = []
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        messages = log_buffer
+        log_buffer = None
+    return result, messages
+
+
+def replay_log(messages):
+    """Print log messages that have been buffered by run_with_log_buffer"""
+    for text, status, nl in messages:
+        log(text, status, nl)
+
 
+def init_worker(cache, cache_settings):
+    """Initialize a worker process with the loaded files and the schema cache settings of the parent process"""
+    file_cache.update(cache)
+    schema_cache.configure(**cache_settings)
 
-def load_file(uri):
-    """Load files from various sources"""
+
+def load_file(uri, persistent_cache = False):
+    """
+    Load files from various sources.
+
+    Set persistent_cache to True for schemas, which are then stored in the persistent schema cache if loaded via http(s).
+    Other files (e.g. collections or mappings) are always loaded from the source.
+    """
     if uri in file_cache:
         return file_cache[uri]
 
-    fs = get_fs(uri)
-
-    with fs.open(uri) as f:
-        data = f.read()
+    if persistent_cache and schema_cache.is_cacheable(uri):
+        data = schema_cache.fetch(uri)
+    else:
+        fs = get_fs(uri)
+        with fs.open(uri) as f:
+            data = f.read()
 
     if uri.endswith(".yml") or uri.endswith(".yaml"):
         data = yaml.safe_load(data)
@@ -48,6 +90,81 @@ def load_file(uri):
 
     return data
 
+def get_file_size(uri):
+    """Returns the size of a file in bytes or None if the size can't be determined"""
+    try:
+        return get_fs(uri).size(uri)
+    except Exception:
+        return None
+
+
+def is_geojsonseq(uri):
+    return uri.endswith(tuple(GEOJSONSEQ_EXTENSIONS))
+
+
+def iter_geojsonseq(uri):
+    """Reads newline-delimited GeoJSON (GeoJSONSeq / NDJSON) feature by feature"""
+    fs = get_fs(uri)
+    with fs.open(uri, "rt", encoding="utf-8") as f:
+        for line in f:
+            # GeoJSONSeq (RFC 8142) prefixes each record with a record separator
+            line = line.strip("\x1e \t\r\n")
+            if len(line) > 0:
+                yield json.loads(line)
+
+
+def read_geojson_members(events, stop_at_features = False):
+    """
+    Builds the top-level members of a GeoJSON object from ijson events, except for the features.
+
+    The events of the features are skipped without building objects. If stop_at_features is True,
+    stops at the features so that the remaining events can be used to read them.
+    """
+    from ijson.common import ObjectBuilder
+
+    members = {}
+    builder = None
+    for prefix, event, value in events:
+        if prefix == "":
+            if event == "map_key":
+                if value == "features" and stop_at_features:
+                    break
+                builder = None if value == "features" else ObjectBuilder()
+                if builder is not None:
+                    members[value] = builder
+            elif event not in ("start_map", "end_map"):
+                raise Exception("Must be a JSON object")
+        elif builder is not None:
+            builder.event(event, value)
+
+    return {key: builder.value for key, builder in members.items()}
+
+
+def load_geojson_header(uri):
+    """Loads all top-level members of a GeoJSON file except for the features, requires ijson"""
+    import ijson
+
+    fs = get_fs(uri)
+    with fs.open(uri) as f:
+        return read_geojson_members(ijson.parse(f, use_float = True))
+
+
+def iter_geojson(uri):
+    """
+    Parses a GeoJSON FeatureCollection in a single pass, requires ijson.
+
+    Yields the top-level members that precede the features first and then the features one by one.
+    Members that follow the features are not available, see load_geojson_header.
+    """
+    import ijson
+
+    fs = get_fs(uri)
+    with fs.open(uri) as f:
+        events = ijson.parse(f, use_float = True)
+        yield read_geojson_members(events, stop_at_features = True)
+        yield from ijson.items(events, "features.item")
+
+
 def get_pyarrow_file(uri) -> NativeFile:
     fs = get_fs(uri)
     pyarrow_fs = PyFileSystem(FSSpecHandler(fs))
@@ -68,13 +185,46 @@ def load_parquet_metadata(uri: Union[str, NativeFile]) -> pq.FileMetaData:
     return pq.read_metadata(uri)
 
 
-def load_parquet_data(uri: str, nrows = None, columns = None) -> pd.DataFrame:
-    """Load data from Parquet file"""
+def load_parquet_table(uri: str, columns = None) -> pa.Table:
+    """Load data from Parquet file as pyarrow Table"""
     f = get_pyarrow_file(uri)
+    return pq.read_table(f, columns = columns)
+
+
+def iter_parquet_batches(uri: str, columns = None, batch_size = None, row_groups = None, metadata = None):
+    """
+    Iterate over the data of a Parquet file.
+
+    Yields the index of the row group, the offset of the first row in the file and the data
+    for each row group, or for each batch of rows if a batch size is given.
+    Reads all row groups by default or only the row groups with the given indices.
+    The metadata of the file is read unless it is given.
+    """
+    f = get_pyarrow_file(uri)
+    pf = pq.ParquetFile(f, metadata = metadata)
+    if row_groups is None:
+        row_groups = range(pf.num_row_groups)
+
+    offsets = [0]
+    for i in range(pf.num_row_groups):
+        offsets.append(offsets[-1] + pf.metadata.row_group(i).num_rows)
+
+    for i in row_groups:
+        offset = offsets[i]
+        if batch_size is None:
+            yield i, offset, pf.read_row_group(i, columns = columns)
+        else:
+            for batch in pf.iter_batches(batch_size = batch_size, row_groups = [i], columns = columns):
+                yield i, offset, batch
+                offset += batch.num_rows
+
 
+def load_parquet_data(uri: str, nrows = None, columns = None) -> pd.DataFrame:
+    """Load data from Parquet file"""
     if nrows is None:
-        table = pq.read_table(f, columns = columns)
+        table = load_parquet_table(uri, columns = columns)
     else:
+        f = get_pyarrow_file(uri)
         pf = pq.ParquetFile(f)
         rows = next(pf.iter_batches(batch_size = nrows, columns = columns))
         table = pa.Table.from_batches([rows])
@@ -91,13 +241,13 @@ def load_fiboa_schema(config):
     schema_version = config.get('fiboa_version', fiboa_version)
     if not schema_url:
         schema_url = f"https://fiboa.github.io/specification/v{schema_version}/schema.yaml"
-    return load_file(schema_url)
+    return load_file(schema_url, persistent_cache = True)
 
 
 def load_datatypes(version):
     # todo: allow to define a seperate schema from a file (as in load_fiboa_schema)
     dt_url = f"https://fiboa.github.io/specification/v{version}/geojson/datatypes.json"
-    response = load_file(dt_url)
+    response = load_file(dt_url, persistent_cache = True)
     return response["$defs"]
 
 
@@ -224,6 +374,41 @@ def parse_converter_input_files(ctx, param, value):
     return sources
 
 
+def parse_sample(ctx, param, value):
+    """
+    Parse a sample size, either a number of rows (integer, optionally with the suffix "rows")
+    or a fraction of the row groups (float between 0 and 1 or a percentage).
+    """
+    if value is None:
+        return None
+
+    value = value.strip().lower()
+    try:
+        if value.endswith("%"):
+            sample = float(value[:-1]) / 100
+            if 0 < sample <= 1:
+                return sample
+        elif value.endswith("rows"):
+            sample = int(value[:-4])
+            if sample > 0:
+                return sample
+        elif re.match(r"^\d+$", value):
+            sample = int(value)
+            # 1 could be meant as a single row or as all row groups
+            if sample == 1:
+                raise click.BadParameter('Sample 1 is ambiguous, use "1 rows" for a single row or "100%" for all row groups')
+            if sample > 0:
+                return sample
+        else:
+            sample = float(value)
+            if 0 < sample <= 1:
+                return sample
+    except ValueError:
+        pass
+
+    raise click.BadParameter('Sample must be a positive number of rows (e.g. 100000), a fraction between 0 and 1 or a percentage of the row groups (e.g. 10%)')
+
+
 def parse_map(value, separator = "="):
     if value is None:
         return {}
@@ -324,14 +509,14 @@ def to_iso8601(dt):
 
 def load_collection_schema(obj):
     if "stac_version" in obj:
-        return load_file(STAC_COLLECTION_SCHEMA.format(version = obj["stac_version"]))
+        return load_file(STAC_COLLECTION_SCHEMA.format(version = obj["stac_version"]), persistent_cache = True)
     else:
         return None
 
 
 def load_geoparquet_schema(obj):
     if "version" in obj:
-        return load_file(GEOPARQUET_SCHEMA.format(version = obj["version"]))
+        return load_file(GEOPARQUET_SCHEMA.format(version = obj["version"]), persistent_cache = True)
     else:
         return None
 
@@ -347,22 +532,46 @@ def log_extensions(collection, logger):
 
 
 def create_validator(schema):
+    """
+    Create a JSON Schema validator.
+
+    Validators are cached by the identity of the schema, e.g. to validate all features of a file with the same
+    validator. Only the validators of the most recently used schemas are kept (see VALIDATOR_CACHE_SIZE).
+    """
+    key = id(schema)
+    with validator_cache_lock:
+        if key in validator_cache:
+            cached_schema, validator = validator_cache[key]
+            if cached_schema is schema:
+                validator_cache.move_to_end(key)
+                return validator
+
     if schema["$schema"] == "http://json-schema.org/draft-07/schema#":
         instance = Draft7Validator
     else:
         instance = Draft202012Validator
 
-    return instance(
+    validator = instance(
         schema,
         format_checker = instance.FORMAT_CHECKER,
         registry = referencing.Registry(retrieve = retrieve_remote_schema)
     )
+    # Keep a reference to the schema so that the id can't be reused by another object
+    with validator_cache_lock:
+        validator_cache[key] = (schema, validator)
+        validator_cache.move_to_end(key)
+        while len(validator_cache) > VALIDATOR_CACHE_SIZE:
+            validator_cache.popitem(last = False)
+    return validator
 
 
 def retrieve_remote_schema(uri: str):
-    request = Request(uri)
-    with urlopen(request) as response:
-        return referencing.Resource.from_contents(
-            json.load(response),
-            default_specification=referencing.jsonschema.DRAFT202012,
-        )
+    if schema_cache.is_cacheable(uri):
+        content = schema_cache.fetch(uri)
+    else:
+        with urlopen(Request(uri)) as response:
+            content = response.read()
+    return referencing.Resource.from_contents(
+        json.loads(content),
+        default_specification=referencing.jsonschema.DRAFT202012,
+    )
@@ -1,10 +1,27 @@
+import itertools
 import json
+import math
+import random
+import time
 import pyarrow.types as pat
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import schema_cache
+from .const import GEOJSON_STREAMING_SIZE
 from .types import PA_TYPE_CHECK
 from .jsonschema import create_jsonschema
-from .util import create_validator, get_collection, log as log_, log_extensions, load_datatypes, load_file, load_fiboa_schema, load_parquet_data, load_parquet_schema, merge_schemas, parse_metadata, load_collection_schema, load_geoparquet_schema
-from .validate_data import validate_column
+from .report import Report, describe_error
+from .util import create_validator, file_cache, get_collection, init_worker, get_file_size, is_geojsonseq, iter_geojson, iter_geojsonseq, load_geojson_header, log as log_, log_extensions, load_datatypes, load_file, iter_parquet_batches, load_fiboa_schema, load_parquet_metadata, load_parquet_schema, merge_schemas, parse_metadata, load_collection_schema, load_geoparquet_schema
+from .validate_data import has_checks, merge_issues, remove_proven_rules, row_groups_upper_bound, validate_column
+
+# Number of features that are sent to a worker process at once
+FEATURE_CHUNK_SIZE = 1000
+
+# The schemas that have been sent to a worker process
+worker_schemas = {}
+
 
 def log(text: str, status="info", bullet = True):
     # Indent logs
@@ -12,11 +29,34 @@ def log(text: str, status="info", bullet = True):
     log_(prefix + str(text), status)
 
 
-def validate(file, config):
-    if file.endswith(".json") or file.endswith(".geojson"):
-        return validate_geojson(file, config)
+def validate(file, config, report = None):
+    """Validates a file, the issues found in the data are collected in the report"""
+    if report is None:
+        report = Report(file)
+
+    if file.endswith(".json") or file.endswith(".geojson") or is_geojsonseq(file):
+        return validate_geojson(file, config, report)
     else:
-        return validate_parquet(file, config)
+        return validate_parquet(file, config, report)
+
+
+def preload_schemas(config):
+    """
+    Loads the schemas that are known from the configuration upfront,
+    so that they can be shared with worker processes.
+    """
+    try:
+        version = config.get("fiboa_version")
+        if config.get("collection"):
+            collection = load_file(config.get("collection"))
+            version = version or collection.get("fiboa_version")
+        if version:
+            load_fiboa_schema({**config, "fiboa_version": version})
+            load_datatypes(version)
+        for path in config.get("extension_schemas", {}).values():
+            load_file(path, persistent_cache = True)
+    except Exception:
+        pass # Errors are reported when validating the individual files
 
 
 def validate_collection(collection, config):
@@ -55,7 +95,7 @@ def validate_collection(collection, config):
                         log(f"Redirecting {ext} to {path}", "info")
                     else:
                         path = ext
-                    extensions[ext] = load_file(path)
+                    extensions[ext] = load_file(path, persistent_cache = True)
                 except Exception as e:
                     log(f"Extension {ext} can't be loaded: {e}", "error")
                     valid = False
@@ -65,12 +105,13 @@ def validate_collection(collection, config):
     return valid, extensions
 
 
-def validate_geojson(file, config):
+def validate_geojson(file, config, report):
     valid = True
     extensions = {}
 
     try:
-        data = load_file(file)
+        with report.timer("load"):
+            data, features = load_geojson(file, config.get("collection"))
     except Exception as error:
         log(error, "error")
         return False
@@ -84,7 +125,8 @@ def validate_geojson(file, config):
         config["fiboa_version"] = collection.get("fiboa_version")
 
     if collection is not None:
-        collection_valid, extensions = validate_collection(collection, config)
+        with report.timer("collection"):
+            collection_valid, extensions = validate_collection(collection, config)
         if not collection_valid:
             valid = False
 
@@ -92,29 +134,36 @@ def validate_geojson(file, config):
     datatypes = load_datatypes(config["fiboa_version"])
     schema = create_jsonschema(core_schema, datatypes)
 
-    # Load extensions
+    # Load extensions, the JSON Schemas are compiled only once for all features
+    ext_schemas = {}
     ext_errors = []
     for ext in extensions:
         try:
             uri = ext
             if ext in config["extension_schemas"]:
                 uri = config["extension_schemas"][ext]
-            ext_schema = load_file(uri)
-            json_schema = create_jsonschema(ext_schema, datatypes)
-            extensions[ext] = lambda obj: validate_json_schema(obj, json_schema)
+            ext_schema = load_file(uri, persistent_cache = True)
+            ext_schemas[ext] = create_jsonschema(ext_schema, datatypes)
+            create_validator(ext_schemas[ext])
         except Exception as error:
-            extensions[ext] = None
+            ext_schemas[ext] = None
             ext_errors.append(f"Failed to load extension {ext}: {str(error)}")
 
     for error in ext_errors:
         log(error, "error")
+    for ext, ext_schema in ext_schemas.items():
+        if not ext_schema:
+            log(f"Extension {ext} SKIPPED", "warning")
 
     # Validate
     if not isinstance(data, dict):
         log("Must be a JSON object", "error")
         return False
 
-    if data["type"] == "Feature":
+    if features is not None:
+        # Features are streamed
+        pass
+    elif data["type"] == "Feature":
         features = [data]
     elif data["type"] == "FeatureCollection":
         features = data["features"]
@@ -125,37 +174,113 @@ def validate_geojson(file, config):
         log("Must be a GeoJSON Feature or FeatureCollection", "error")
         return False
 
-    if len(features) == 0:
+    count = 0
+    with report.timer("features"):
+        for sample, errors in check_features(features, schema, ext_schemas, config):
+            count += 1
+            report.add_feature_errors(sample, errors)
+    report.rows = count
+    report.bytes_read = get_file_size(file)
+
+    if report.has_issues():
+        valid = False
+        report.log_issues(log)
+
+    if count == 0:
         log("Must contain at least one Feature", "error")
         return False
 
-    for index, feature in enumerate(features):
-        errors = validate_json_schema(feature, schema)
-        if len(errors) > 0:
-            valid = False
+    return valid
 
-        label = feature.get("id", f"index: {index}")
 
-        if not valid:
-            for error in errors:
-                log(f"{label}: {error}", "error")
-        else:
-            for ext, validate_fn in extensions.items():
-                if validate_fn:
-                    ext_errors = validate_fn(feature)
-                    if len(ext_errors) > 0:
-                        for error in ext_errors:
-                            log(f"{label} (ext {ext}): {error}", "error")
-                        valid = False
-                else:
-                    log(f"{label}: Extension {ext} SKIPPED", "warning")
-            if valid and len(features) > 1:
-                log(f"{label}: VALID", "success")
+def check_features(features, schema, ext_schemas, config):
+    """
+    Validates the features against the core and extension schemas.
+
+    Yields the id (or index) and the errors per feature in the order of the features.
+    If the number of jobs is greater than 1, the features are validated in chunks by worker processes.
+    """
+    jobs = config.get("jobs", 1)
+    if jobs <= 1 or (isinstance(features, list) and len(features) <= FEATURE_CHUNK_SIZE):
+        for index, feature in enumerate(features):
+            yield check_feature(index, feature, schema, ext_schemas)
+        return
+
+    # The schemas are sent to each worker only once, the features are sent in chunks
+    initargs = (schema, ext_schemas, file_cache, schema_cache.settings)
+    with ProcessPoolExecutor(max_workers = jobs, initializer = init_feature_worker, initargs = initargs) as executor:
+        pending = deque()
+        features = enumerate(features)
+        while True:
+            chunk = list(itertools.islice(features, FEATURE_CHUNK_SIZE))
+            if len(chunk) == 0:
+                break
+            pending.append(executor.submit(check_feature_chunk, chunk))
+            # Limit the number of chunks in memory
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().result()
+
+        while len(pending) > 0:
+            yield from pending.popleft().result()
+
+
+def check_feature(index, feature, schema, ext_schemas):
+    errors = [describe_error(error) for error in validate_json_schema(feature, schema)]
+    for ext, ext_schema in ext_schemas.items():
+        if ext_schema:
+            errors += [describe_error(error, ext) for error in validate_json_schema(feature, ext_schema)]
+    return feature.get("id", index), errors
+
+
+def init_feature_worker(schema, ext_schemas, cache, cache_settings):
+    init_worker(cache, cache_settings)
+    worker_schemas["core"] = schema
+    worker_schemas["extensions"] = ext_schemas
+
+
+def check_feature_chunk(chunk):
+    return [
+        check_feature(index, feature, worker_schemas["core"], worker_schemas["extensions"])
+        for index, feature in chunk
+    ]
+
+
+def load_geojson(file, collection = None):
+    """
+    Loads a GeoJSON file.
+
+    Returns the GeoJSON object and None for the features, which are contained in the object.
+    GeoJSONSeq files and large FeatureCollections (if ijson is installed) are streamed instead:
+    In this case the first feature or the FeatureCollection without features is returned together
+    with an iterator over the features.
+    Large FeatureCollections are parsed in a single pass, unless the members that are needed
+    to find the collection follow the features.
+    """
+    if is_geojsonseq(file):
+        features = iter_geojsonseq(file)
+        first = next(features, None)
+        if first is None:
+            return {"type": "FeatureCollection", "features": []}, iter([])
+        return first, itertools.chain([first], features)
+
+    size = get_file_size(file)
+    if size is not None and size > GEOJSON_STREAMING_SIZE:
+        try:
+            features = iter_geojson(file)
+            header = next(features)
+            if "type" not in header or (collection is None and "fiboa" not in header and "links" not in header):
+                # Read the members that follow the features in a separate pass, which skips the features
+                header = load_geojson_header(file)
+            if header.get("type") == "FeatureCollection":
+                return header, features
+            features.close()
+        except ImportError:
+            log("Install ijson to validate large GeoJSON files with less memory: pip install fiboa-cli[geojson]", "warning")
 
-    return valid
+    return load_file(file), None
 
 
-def validate_parquet(file, config):
+def validate_parquet(file, config, report):
     parquet_schema = load_parquet_schema(file)
     valid = True
     extensions = {}
@@ -186,22 +311,14 @@ def validate_parquet(file, config):
 
     # Validate Collection
     if len(collection) > 0:
-        valid_collection, extensions = validate_collection(collection, config)
+        with report.timer("collection"):
+            valid_collection, extensions = validate_collection(collection, config)
         if not valid_collection:
             valid = False
 
     # load the actual fiboa schema
     fiboa_schema = load_fiboa_schema(config)
 
-    # Load data if needed
-    gdf = None
-    if config.get("data"):
-        try:
-            gdf = load_parquet_data(file)
-        except Exception as e:
-            log(f"Data could not be read: {e}", "error")
-            valid = False
-
     # Compile all properties from the schemas
     schemas = fiboa_schema
     for ext in extensions.values():
@@ -219,6 +336,7 @@ def validate_parquet(file, config):
 
     # Validate whether the Parquet schema complies with the property schemas
     properties = schemas.get("properties", {})
+    data_rules = {}
     for key in parquet_schema.names:
         # Ignore fields without a schema
         if key not in properties:
@@ -265,21 +383,175 @@ def validate_parquet(file, config):
         elif dtype == "geometry":
             valid = validate_geometry_column(key, prop_schema, geo, valid)
 
-        # Validate data of the column
-        if gdf is not None:
-            issues = validate_column(gdf[key], prop_schema)
-            if len(issues) > 0:
-                for issue in issues:
-                    log(f"{key}: {issue}")
-                valid = False
+        # Plan to validate the data of the column
+        data_rules[key] = prop_schema
 
-    # Show a note once if data was not validated
-    if not config.get("data"):
+    # Validate data of the columns
+    if config.get("data"):
+        row_groups = None
+        sampled_rows = None
+        try:
+            metadata = load_parquet_metadata(file)
+            if config.get("sample") is not None:
+                row_groups = sample_row_groups(metadata, config.get("sample"), config.get("seed"))
+                if len(row_groups) < metadata.num_row_groups:
+                    sampled_row_groups = {i: metadata.row_group(i).num_rows for i in row_groups}
+                    sampled_rows = sum(sampled_row_groups.values())
+                    report.sampled_row_groups = sampled_row_groups
+                    report.total_row_groups = metadata.num_row_groups
+                    log(f"Validating a random sample of {sampled_rows} of {metadata.num_rows} rows ({len(row_groups)} of {metadata.num_row_groups} row groups)", "info")
+                else:
+                    # The sample covers the whole file, so there's nothing to estimate
+                    row_groups = None
+
+            with report.timer("data"):
+                data_issues = validate_parquet_data(file, data_rules, config, row_groups, report.columns, metadata)
+            report.rows = max([column.get("rows", 0) for column in report.columns.values()], default = 0)
+            report.bytes_read = sum(column.get("bytes", 0) for column in report.columns.values())
+        except Exception as e:
+            log(f"Data could not be read: {e}", "error")
+            data_issues = {}
+            valid = False
+
+        report.sampled_rows = sampled_rows
+        for key, issues in data_issues.items():
+            report.add_issues(key, issues)
+
+        if report.has_issues():
+            valid = False
+            report.log_issues(log)
+        elif sampled_rows:
+            high = row_groups_upper_bound(len(report.sampled_row_groups))
+            log(f"No violations found in the sample, less than {high:.2%} of the row groups contain violations with 95% confidence", "info")
+    else:
+        # Show a note once if data was not validated
         log("Data was not validated as the --data parameter was not provided", "info")
 
     return valid
 
 
+def validate_parquet_data(file, rules, config, row_groups = None, stats = None, metadata = None):
+    """
+    Validates the data of the columns against the property schemas.
+
+    Each column is read independently, so the columns can be validated in parallel threads.
+    The metadata of the file is read once (unless it is given) and shared by all columns.
+    Validates all row groups by default or only the row groups with the given indices.
+    If a dict is given for stats, the statistics for each column are added to it.
+    Returns the issues per column.
+    """
+    if metadata is None:
+        metadata = load_parquet_metadata(file)
+    if stats is None:
+        stats = {}
+    # Create the dicts upfront so that the threads don't modify the dict of all columns
+    for key in rules:
+        stats[key] = {}
+
+    threads = config.get("threads") or 1
+    if threads > 1 and len(rules) > 1:
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            futures = {key: executor.submit(validate_parquet_column, file, key, prop_schema, config, row_groups, stats[key], metadata) for key, prop_schema in rules.items()}
+            return {key: future.result() for key, future in futures.items()}
+    else:
+        return {key: validate_parquet_column(file, key, prop_schema, config, row_groups, stats[key], metadata) for key, prop_schema in rules.items()}
+
+
+def sample_row_groups(metadata, sample, seed = None):
+    """
+    Randomly picks row groups from a Parquet file.
+
+    If the sample is a float between 0 and 1, it's the fraction of row groups to pick.
+    Otherwise it's the minimum number of rows to pick.
+    The same row groups are picked for the same seed.
+    Returns the sorted indices of the row groups.
+    """
+    rng = random.Random(seed)
+    num_row_groups = metadata.num_row_groups
+    if isinstance(sample, float):
+        count = max(1, math.ceil(sample * num_row_groups))
+        return sorted(rng.sample(range(num_row_groups), min(count, num_row_groups)))
+
+    row_groups = []
+    rows = 0
+    for i in rng.sample(range(num_row_groups), num_row_groups):
+        if rows >= sample:
+            break
+        row_groups.append(i)
+        rows += metadata.row_group(i).num_rows
+
+    return sorted(row_groups)
+
+
+def validate_parquet_column(file, key, prop_schema, config, row_groups = None, stats = None, metadata = None):
+    """
+    Validates the data of a single column against the property schema.
+
+    Validates all row groups by default or only the row groups with the given indices.
+    Rules that hold according to the statistics (min/max) of a row group are not checked again
+    and row groups are only read if any rule remains to be checked.
+    Only the given column is read from the file and it is streamed row group by row group
+    (or in batches of the configured size), so only a single batch is held in memory at any time.
+    If a dict is given for stats, the number of rows and bytes read, the time spent
+    and the statistics per rule are added to it.
+    The metadata of the file is read unless it is given.
+    Returns the issues, merged over all batches.
+    """
+    start = time.perf_counter()
+    if stats is None:
+        stats = {}
+    stats.update({"rows": 0, "bytes": 0, "skipped_row_groups": 0, "seconds": 0.0, "rules": {}})
+
+    # Determine the rules that can't be proven by the statistics for each row group
+    if metadata is None:
+        metadata = load_parquet_metadata(file)
+    row_group_rules = {}
+    if row_groups is None:
+        row_groups = range(metadata.num_row_groups)
+    for i in row_groups:
+        row_group = metadata.row_group(i)
+        rules = remove_proven_rules(prop_schema, get_column_chunk(row_group, key))
+        if has_checks(rules):
+            row_group_rules[i] = rules
+            stats["bytes"] += get_column_size(row_group, key)
+        else:
+            stats["skipped_row_groups"] += 1
+
+    issues = []
+    if len(row_group_rules) > 0:
+        batches = iter_parquet_batches(file, columns = [key], batch_size = config.get("batch_size"), row_groups = list(row_group_rules.keys()), metadata = metadata)
+        for row_group, offset, batch in batches:
+            stats["rows"] += batch.num_rows
+            batch_issues = validate_column(batch.column(0), row_group_rules[row_group], offset, stats["rules"])
+            for issue in batch_issues:
+                issue.row_groups = {row_group: issue.count}
+            merge_issues(issues, batch_issues)
+            del batch
+
+    stats["seconds"] = time.perf_counter() - start
+    return issues
+
+
+def get_column_chunk(row_group, key):
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        if column.path_in_schema == key:
+            return column
+
+    return None
+
+
+def get_column_size(row_group, key):
+    """Returns the compressed size of a column in a row group in bytes, including all nested columns"""
+    size = 0
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        if column.path_in_schema == key or column.path_in_schema.startswith(key + "."):
+            size += column.total_compressed_size
+
+    return size
+
+
 def validate_geometry_column(key, prop_schema, geo, valid = True):
     columns = geo.get("columns", {})
     if key not in columns:
@@ -336,5 +608,9 @@ def validate_json_schema(obj, schema):
         obj = json.loads(obj)
 
     validator = create_validator(schema)
+    # Checking validity stops at the first error, so it's faster for valid objects
+    if validator.is_valid(obj):
+        return []
+
     errors = sorted(validator.iter_errors(obj), key=lambda e: e.path)
     return errors
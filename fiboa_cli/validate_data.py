@@ -1,147 +1,519 @@
+import math
 import re
-import pandas as pd
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.types as pat
+import shapely
 
 from urllib.parse import urlparse
 from shapely.validation import explain_validity
 
-from .types import PYTHON_TYPES, is_numerical_type, is_scalar_type
+from .types import is_numerical_type, is_scalar_type
 
 REGEX_EMAIL = re.compile("^[^@]+@[^@]+\\.[^@]+$")
 REGEX_UUID = re.compile("^[0-9a-f]{8}-[0-9a-f]{4}-[1-5][0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$")
+REGEX_LOCATION = re.compile("\\[[^\\]]*\\]$")
 
-def validate_column(data, rules):
-    for value in data:
-        isna = pd.isna(value)
-        if isinstance(isna, bool) and isna:
-            # Skip validation for NaN values or implement special handling if required
-            continue
-
-        dtype = rules.get("type")
-        expected_pytype = PYTHON_TYPES.get(dtype)
-        if expected_pytype is not None and not isinstance(value, expected_pytype):
-            actualy_pytype = type(value)
-            return [f"Value '{value}' is not of type {dtype}, is {actualy_pytype}"]
-
-        if dtype == "string":
-            issues = validate_string(value, rules)
-        elif is_numerical_type(dtype):
-            issues = validate_numerical(value, rules)
-        elif dtype == "array":
-            issues = validate_array(value, rules)
-        elif dtype == "geometry":
-            issues = validate_geometry(value, rules)
-        elif dtype == "bounding-box":
-            issues = validate_bbox(value, rules)
-        elif dtype == "object":
-            issues = validate_object(value, rules)
-        else:
-            continue
+# Number of row indices that are kept as examples for each violated rule
+MAX_SAMPLES = 5
+# Number of geometries that are decoded from WKB at once
+GEOMETRY_CHUNK_SIZE = 65536
 
-        if len(issues) > 0:
-            return issues
 
-    return []
+class Issue:
+    """A violated rule of a column with the number of affected rows and some example rows"""
+
+    def __init__(self, rule, message, count = 1, samples = None, detail = None, unit = "row"):
+        self.rule = rule
+        # Distinguishes issues of the same rule, e.g. the reason why geometries are invalid
+        self.detail = detail
+        self.message = message
+        self.count = count
+        self.samples = samples if samples is not None else []
+        # What the samples refer to, e.g. rows or features
+        self.unit = unit
+        # Number of affected rows per row group, only collected for Parquet files
+        self.row_groups = {}
+
+    def __str__(self):
+        if self.count == 1 and len(self.samples) == 1:
+            return f"{self.message} ({self.unit} {self.samples[0]})"
+
+        samples = ", ".join(map(str, self.samples))
+        return f"{self.message} ({self.count} {self.unit}s, e.g. {samples})"
+
+    def __repr__(self):
+        return f"Issue({self.rule!r}, count={self.count})"
+
+
+def validate_column(data, rules, offset = 0, stats = None):
+    """
+    Validates all values of a column (pyarrow Array or ChunkedArray) against the rules of the property schema.
+
+    Returns a list of issues, one per violated rule.
+    The row indices of the examples are shifted by the given offset.
+    If a dict is given for stats, the number of rows, violations and the time spent are added per rule.
+    """
+    if rules.get("type") == "geometry":
+        return validate_wkb(data, rules, offset, stats)
 
-# Geometry validation
-def validate_bbox(value, rules):
     issues = []
+    for rule, compute_mask, create_message in compile_rules(rules):
+        start = time.perf_counter()
+        issue = check_rule(data, rule, compute_mask, create_message, offset)
+        add_stats(stats, rule, len(data), issue, start)
+        if issue is not None:
+            issues.append(issue)
+
+    return issues
+
+
+def add_stats(stats, rule, rows, issues, start):
+    """Adds the number of rows, violations and the time since start (see time.perf_counter) for a rule to the stats"""
+    if stats is None:
+        return
+    if issues is None:
+        issues = []
+    elif isinstance(issues, Issue):
+        issues = [issues]
+
+    rule_stats = stats.setdefault(rule, {"rows": 0, "violations": 0, "seconds": 0.0})
+    rule_stats["rows"] += rows
+    rule_stats["violations"] += sum(issue.count for issue in issues)
+    rule_stats["seconds"] += time.perf_counter() - start
+
+
+def estimate_violation_rate(row_groups, sampled_row_groups, total_row_groups, z = 1.96):
+    """
+    Estimates the violation rate of a file from a random sample of its row groups.
+
+    The rows of a row group are not independent (e.g. sorted or spatially clustered data), so the row groups are
+    the sampling units: The rate is the ratio of violations to rows in the sample and its variance is computed
+    from the deviations per row group (ratio estimator for a cluster sample without replacement).
+    row_groups are the number of violations per row group, sampled_row_groups the number of rows per sampled row group.
+    Returns the rate and the lower and upper bound, by default for a confidence level of 95%.
+    The bounds are 0 and 1 if less than two row groups have been sampled.
+    """
+    n = len(sampled_row_groups)
+    rows = sum(sampled_row_groups.values())
+    if rows == 0:
+        return 0.0, 0.0, 1.0
+
+    rate = sum(row_groups.values()) / rows
+    if n < 2:
+        return rate, 0.0, 1.0
+
+    mean_rows = rows / n
+    deviations = sum((row_groups.get(i, 0) - rate * num_rows) ** 2 for i, num_rows in sampled_row_groups.items())
+    variance = (1 - n / total_row_groups) * deviations / (n - 1) / (n * mean_rows ** 2)
+    margin = z * math.sqrt(variance)
+    return rate, max(0.0, rate - margin), min(1.0, rate + margin)
+
+
+def row_groups_upper_bound(n, confidence = 0.95):
+    """
+    Upper bound for the share of row groups with violations if none has been found in n sampled row groups.
+    """
+    return 1 - (1 - confidence) ** (1 / n)
 
-    if value["xmin"] > value["xmax"]:
-        issues.append(f"Bounding box has xmin value greater than xmax value: {value['xmin']} > {value['xmax']}")
-    elif value["ymin"] > value["ymax"]:
-        issues.append(f"Bounding box has ymin value greater than ymax value: {value['ymin']} > {value['ymax']}")
+
+def has_checks(rules):
+    """Checks whether any of the rules requires to validate the data"""
+    return rules.get("type") == "geometry" or len(compile_rules(rules)) > 0
+
+
+def remove_proven_rules(rules, column_chunk):
+    """
+    Removes the rules from the property schema that hold for all values of a column chunk
+    according to its statistics (min/max, null count), returns the remaining rules.
+    """
+    statistics = column_chunk.statistics if column_chunk is not None else None
+    if statistics is None:
+        return rules
+
+    # Null values are not validated, so all rules hold if there are only null values
+    if statistics.has_null_count and statistics.null_count == column_chunk.num_values:
+        return {"type": rules.get("type")}
+
+    if not statistics.has_min_max:
+        return rules
+
+    dtype = rules.get("type")
+    minimum, maximum = statistics.min, statistics.max
+    proven = set()
+    if is_numerical_type(dtype):
+        if 'minimum' in rules and minimum >= rules['minimum']:
+            proven.add('minimum')
+        if 'maximum' in rules and maximum <= rules['maximum']:
+            proven.add('maximum')
+        if 'exclusiveMinimum' in rules and minimum > rules['exclusiveMinimum']:
+            proven.add('exclusiveMinimum')
+        if 'exclusiveMaximum' in rules and maximum < rules['exclusiveMaximum']:
+            proven.add('exclusiveMaximum')
+    if dtype == "string" or is_numerical_type(dtype):
+        if 'enum' in rules and minimum == maximum and minimum in rules['enum']:
+            proven.add('enum')
+
+    return {k: v for k, v in rules.items() if k not in proven}
+
+
+def merge_issues(issues, new_issues):
+    """Merges the issues of another batch of rows into the given list of issues (in-place)"""
+    for new_issue in new_issues:
+        issue = next((i for i in issues if i.rule == new_issue.rule and i.detail == new_issue.detail), None)
+        if issue is None:
+            issues.append(new_issue)
+        else:
+            issue.count += new_issue.count
+            issue.samples = (issue.samples + new_issue.samples)[:MAX_SAMPLES]
+            for i, count in new_issue.row_groups.items():
+                issue.row_groups[i] = issue.row_groups.get(i, 0) + count
 
     return issues
 
+
+def compile_rules(rules):
+    """
+    Compiles the property schema into a list of checks.
+
+    Each check consists of the rule name, a function that computes a boolean mask
+    (true = rule is violated) for a whole column and a function that creates the
+    message for the first violating value.
+    """
+    dtype = rules.get("type")
+    if dtype == "string":
+        return compile_string(rules)
+    elif is_numerical_type(dtype):
+        return compile_numerical(rules)
+    elif dtype == "array":
+        return compile_array(rules)
+    elif dtype == "bounding-box":
+        return compile_bbox(rules)
+    elif dtype == "object":
+        return compile_object(rules)
+    else:
+        return []
+
+
+def check_rule(data, rule, compute_mask, create_message, offset = 0):
+    mask = compute_mask(data)
+    if isinstance(mask, np.ndarray):
+        mask = pa.array(mask, type = pa.bool_())
+
+    # Skip validation for null and NaN values
+    mask = pc.and_(mask, is_present(data))
+    mask = pc.fill_null(mask, False)
+
+    count = pc.sum(mask).as_py()
+    if not count:
+        return None
+
+    if isinstance(mask, pa.ChunkedArray):
+        mask = mask.combine_chunks()
+    indices = pc.indices_nonzero(mask)[:MAX_SAMPLES].to_pylist()
+    message = create_message(get_value(data, indices[0]))
+    return Issue(rule, message, count, [offset + i for i in indices])
+
+
+def is_present(data):
+    present = pc.is_valid(data)
+    if pat.is_floating(data.type):
+        present = pc.and_(present, pc.invert(pc.is_nan(data)))
+    return present
+
+
+def get_value(data, index):
+    value = data[index]
+    if isinstance(value, pa.Scalar):
+        value = value.as_py()
+    return value
+
+
+def match_values(data, predicate):
+    """Applies a Python predicate to the distinct values of a column, returns a boolean mask"""
+    matching = [value for value in pc.unique(data).to_pylist() if value is not None and predicate(value)]
+    return pc.is_in(data, value_set = pa.array(matching, type = data.type))
+
+
+def match_pattern(data, pattern):
+    try:
+        # Python's re.match only anchors at the beginning of the string
+        return pc.match_substring_regex(data, f"^(?:{pattern})")
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Pattern is not supported by RE2, fall back to Python's regular expressions
+        regex = re.compile(pattern)
+        return match_values(data, lambda value: regex.match(value) is not None)
+
+
+def is_in_enum(data, enum):
+    try:
+        return pc.is_in(data, value_set = pa.array(enum))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        return match_values(data, lambda value: value in enum)
+
+
+# Bounding box validation
+def compile_bbox(rules):
+    def x_mask(data):
+        return pc.greater(pc.struct_field(data, "xmin"), pc.struct_field(data, "xmax"))
+
+    def y_mask(data):
+        return pc.greater(pc.struct_field(data, "ymin"), pc.struct_field(data, "ymax"))
+
+    return [
+        ("xmin", x_mask, lambda value: f"Bounding box has xmin value greater than xmax value: {value['xmin']} > {value['xmax']}"),
+        ("ymin", y_mask, lambda value: f"Bounding box has ymin value greater than ymax value: {value['ymin']} > {value['ymax']}"),
+    ]
+
+
 # Geometry validation
-def validate_geometry(value, rules):
+def validate_wkb(data, rules, offset = 0, stats = None):
+    """
+    Validates a column of WKB-encoded geometries (pyarrow Array or ChunkedArray).
+
+    The WKB is decoded in chunks of at most GEOMETRY_CHUNK_SIZE rows,
+    so that shapely objects only exist for one chunk at a time.
+    """
+    issues = []
+    chunks = data.chunks if isinstance(data, pa.ChunkedArray) else [data]
+    for chunk in chunks:
+        for start in range(0, len(chunk), GEOMETRY_CHUNK_SIZE):
+            wkb = chunk.slice(start, GEOMETRY_CHUNK_SIZE)
+            decode_start = time.perf_counter()
+            geometries = shapely.from_wkb(wkb.to_numpy(zero_copy_only = False))
+            add_stats(stats, "wkb", len(wkb), None, decode_start)
+            merge_issues(issues, validate_geometries(geometries, rules, offset, stats))
+            offset += len(wkb)
+            del geometries
+
+    return issues
+
+
+def validate_geometries(geometries, rules, offset = 0, stats = None):
+    """
+    Validates an array of shapely geometries at once.
+
+    Returns one issue per disallowed geometry type and per reason for invalid geometries.
+    The reasons are only determined for the invalid geometries.
+    """
     issues = []
+    present = ~shapely.is_missing(geometries)
 
     geom_types = rules.get("geometryTypes", [])
-    if len(geom_types) > 0 and value.geom_type not in geom_types:
+    if len(geom_types) > 0:
+        start = time.perf_counter()
+        type_issues = []
         allowed = ", ".join(geom_types)
-        issues.append(f"Geometry type '{value.geom_type}' is not one of the allowed types: {allowed}")
+        type_ids = shapely.get_type_id(geometries)
+        allowed_ids = [GEOMETRY_TYPE_IDS[t] for t in geom_types if t in GEOMETRY_TYPE_IDS]
+        disallowed = present & ~np.isin(type_ids, allowed_ids)
+        for type_id in np.unique(type_ids[disallowed]):
+            indices = np.flatnonzero(disallowed & (type_ids == type_id))
+            geom_type = geometries[indices[0]].geom_type
+            message = f"Geometry type '{geom_type}' is not one of the allowed types: {allowed}"
+            type_issues.append(Issue("geometryTypes", message, len(indices), to_samples(indices, offset), geom_type))
+        add_stats(stats, "geometryTypes", len(geometries), type_issues, start)
+        issues += type_issues
 
-    why = explain_validity(value)
-    if why != 'Valid Geometry':
-        issues.append(f"Geometry {value} is not valid: {why}")
+    start = time.perf_counter()
+    valid_issues = []
+    invalid = np.flatnonzero(present & ~shapely.is_valid(geometries))
+    if len(invalid) > 0:
+        reasons = explain_validity(geometries[invalid])
+        # Group by the reason without the location, e.g. Self-intersection[0.5 0.5]
+        kinds = np.array([REGEX_LOCATION.sub("", reason) for reason in reasons])
+        for kind in np.unique(kinds):
+            matches = np.flatnonzero(kinds == kind)
+            indices = invalid[matches]
+            message = f"Geometry {geometries[indices[0]]} is not valid: {reasons[matches[0]]}"
+            valid_issues.append(Issue("valid", message, len(indices), to_samples(indices, offset), kind))
+    add_stats(stats, "valid", len(geometries), valid_issues, start)
+    issues += valid_issues
 
     return issues
 
+
+def to_samples(indices, offset = 0):
+    return [offset + int(i) for i in indices[:MAX_SAMPLES]]
+
+
+GEOMETRY_TYPE_IDS = {
+    "Point": 0,
+    "LineString": 1,
+    "LinearRing": 2,
+    "Polygon": 3,
+    "MultiPoint": 4,
+    "MultiLineString": 5,
+    "MultiPolygon": 6,
+    "GeometryCollection": 7,
+}
+
+
 # String validation
-def validate_string(value, rules):
-    issues = []
-    if 'minLength' in rules and len(value) < rules['minLength']:
-        issues.append(f"String '{value}' is shorter than the minimum length of {rules['minLength']}.")
-    if 'maxLength' in rules and len(value) > rules['maxLength']:
-        issues.append(f"String '{value}' is longer than the maximum length of {rules['maxLength']}.")
-    if 'pattern' in rules and not re.match(rules['pattern'], value):
-        issues.append(f"String '{value}' does not match the required pattern: {rules['pattern']}.")
-    if 'enum' in rules and value not in rules['enum']:
+def compile_string(rules):
+    checks = []
+    if 'minLength' in rules:
+        checks.append((
+            "minLength",
+            lambda data: pc.less(pc.utf8_length(data), rules['minLength']),
+            lambda value: f"String '{value}' is shorter than the minimum length of {rules['minLength']}."
+        ))
+    if 'maxLength' in rules:
+        checks.append((
+            "maxLength",
+            lambda data: pc.greater(pc.utf8_length(data), rules['maxLength']),
+            lambda value: f"String '{value}' is longer than the maximum length of {rules['maxLength']}."
+        ))
+    if 'pattern' in rules:
+        checks.append((
+            "pattern",
+            lambda data: pc.invert(match_pattern(data, rules['pattern'])),
+            lambda value: f"String '{value}' does not match the required pattern: {rules['pattern']}."
+        ))
+    if 'enum' in rules:
         allowed = ", ".join(rules['enum'])
-        issues.append(f"String '{value}' is not one of the allowed values in the enumeration: {allowed}")
+        checks.append((
+            "enum",
+            lambda data: pc.invert(is_in_enum(data, rules['enum'])),
+            lambda value: f"String '{value}' is not one of the allowed values in the enumeration: {allowed}"
+        ))
     if 'format' in rules:
-        if rules['format'] == 'email' and not REGEX_EMAIL.match(value):
-            issues.append(f"String '{value}' is not a valid email address.")
-        if rules['format'] == 'uri' and not urlparse(value).scheme:
-            issues.append(f"String '{value}' is not a valid URI.")
-        if rules['format'] == 'uuid' and not REGEX_UUID.match(value):
-            issues.append(f"String '{value}' is not a valid UUID.")
-    return issues
+        if rules['format'] == 'email':
+            checks.append((
+                "format",
+                lambda data: pc.invert(match_pattern(data, REGEX_EMAIL.pattern)),
+                lambda value: f"String '{value}' is not a valid email address."
+            ))
+        if rules['format'] == 'uri':
+            checks.append((
+                "format",
+                lambda data: pc.invert(match_values(data, lambda value: bool(urlparse(value).scheme))),
+                lambda value: f"String '{value}' is not a valid URI."
+            ))
+        if rules['format'] == 'uuid':
+            checks.append((
+                "format",
+                lambda data: pc.invert(match_pattern(data, REGEX_UUID.pattern)),
+                lambda value: f"String '{value}' is not a valid UUID."
+            ))
+    return checks
+
 
 # Numerical validation
-def validate_numerical(value, rules):
-    issues = []
-    if 'minimum' in rules and value < rules['minimum']:
-        issues.append(f"Value {value} is less than the minimum allowed value of {rules['minimum']}.")
-    if 'maximum' in rules and value > rules['maximum']:
-        issues.append(f"Value {value} is greater than the maximum allowed value of {rules['maximum']}.")
-    if 'exclusiveMinimum' in rules and value <= rules['exclusiveMinimum']:
-        issues.append(f"Value {value} is less than or equal to the exclusive minimum value of {rules['exclusiveMinimum']}.")
-    if 'exclusiveMaximum' in rules and value >= rules['exclusiveMaximum']:
-        issues.append(f"Value {value} is greater than or equal to the exclusive maximum value of {rules['exclusiveMaximum']}.")
-    if 'enum' in rules and value not in rules['enum']:
+def compile_numerical(rules):
+    checks = []
+    if 'minimum' in rules:
+        checks.append((
+            "minimum",
+            lambda data: pc.less(data, rules['minimum']),
+            lambda value: f"Value {value} is less than the minimum allowed value of {rules['minimum']}."
+        ))
+    if 'maximum' in rules:
+        checks.append((
+            "maximum",
+            lambda data: pc.greater(data, rules['maximum']),
+            lambda value: f"Value {value} is greater than the maximum allowed value of {rules['maximum']}."
+        ))
+    if 'exclusiveMinimum' in rules:
+        checks.append((
+            "exclusiveMinimum",
+            lambda data: pc.less_equal(data, rules['exclusiveMinimum']),
+            lambda value: f"Value {value} is less than or equal to the exclusive minimum value of {rules['exclusiveMinimum']}."
+        ))
+    if 'exclusiveMaximum' in rules:
+        checks.append((
+            "exclusiveMaximum",
+            lambda data: pc.greater_equal(data, rules['exclusiveMaximum']),
+            lambda value: f"Value {value} is greater than or equal to the exclusive maximum value of {rules['exclusiveMaximum']}."
+        ))
+    if 'enum' in rules:
         allowed = ", ".join(map(str, rules['enum']))
-        issues.append(f"Integer '{value}' is not one of the allowed values in the enumeration: {allowed}")
-    return issues
+        checks.append((
+            "enum",
+            lambda data: pc.invert(is_in_enum(data, rules['enum'])),
+            lambda value: f"Integer '{value}' is not one of the allowed values in the enumeration: {allowed}"
+        ))
+    return checks
+
 
 # Array validation
-def validate_array(values, rules):
-    issues = []
+def compile_array(rules):
+    checks = []
 
     item_schema = rules.get('items', {})
 
-    if 'minItems' in rules and len(values) < rules['minItems']:
-        issues.append(f"Array has fewer items than the minimum of {rules['minItems']}.")
-    if 'maxItems' in rules and len(values) > rules['maxItems']:
-        issues.append(f"Array has more items than the maximum of {rules['maxItems']}.")
+    if 'minItems' in rules:
+        checks.append((
+            "minItems",
+            lambda data: pc.less(pc.list_value_length(data), rules['minItems']),
+            lambda value: f"Array has fewer items than the minimum of {rules['minItems']}."
+        ))
+    if 'maxItems' in rules:
+        checks.append((
+            "maxItems",
+            lambda data: pc.greater(pc.list_value_length(data), rules['maxItems']),
+            lambda value: f"Array has more items than the maximum of {rules['maxItems']}."
+        ))
 
     if 'uniqueItems' in rules and rules['uniqueItems']:
         item_dtype = item_schema.get('type')
-        if is_scalar_type(item_dtype) and len(values) != len(set(values)):
-            issues.append("Array items are not unique.")
+        if is_scalar_type(item_dtype):
+            checks.append((
+                "uniqueItems",
+                lambda data: np.array([values is not None and len(values) != len(set(values)) for values in data.to_pylist()], dtype = bool),
+                lambda value: "Array items are not unique."
+            ))
         else:
             pass # not supported for non-scalar types
 
-
     # todo: Further validation for 'items' if necessary
-    return issues
+    return checks
+
 
 # Object validation
-def validate_object(value, rules):
-    issues = []
+def compile_object(rules):
+    checks = []
 
-    if 'minProperties' in rules and len(value) < rules['minProperties']:
-        issues.append(f"Object has fewer properties than the minimum of {rules['minProperties']}.")
-    if 'maxProperties' in rules and len(value) > rules['maxProperties']:
-        issues.append(f"Object has more properties than the maximum of {rules['maxProperties']}.")
+    if 'minProperties' in rules:
+        checks.append((
+            "minProperties",
+            lambda data: pc.less(count_properties(data), rules['minProperties']),
+            lambda value: f"Object has fewer properties than the minimum of {rules['minProperties']}."
+        ))
+    if 'maxProperties' in rules:
+        checks.append((
+            "maxProperties",
+            lambda data: pc.greater(count_properties(data), rules['maxProperties']),
+            lambda value: f"Object has more properties than the maximum of {rules['maxProperties']}."
+        ))
 
     props = rules.get('properties', {})
     other_props = rules.get('additionalProperties', False)
     pattern_props = rules.get('patternProperties', {})
     for key, val in props.items():
-        if key not in value:
-            issues.append(f"Key '{key}' is missing from the object.")
+        checks.append((
+            "properties",
+            lambda data, key = key: is_key_missing(data, key),
+            lambda value, key = key: f"Key '{key}' is missing from the object."
+        ))
         # todo: Further validation based on the type of property
 
-    return issues
+    return checks
+
+
+def count_properties(data):
+    if pat.is_struct(data.type):
+        return pa.array(np.full(len(data), data.type.num_fields))
+
+    # Maps are lists of key/value structs
+    entries = pa.struct([data.type.key_field, data.type.item_field])
+    return pc.list_value_length(data.cast(pa.list_(entries)))
+
+
+def is_key_missing(data, key):
+    if pat.is_struct(data.type):
+        return pa.array(np.full(len(data), data.type.get_field_index(key) < 0))
+
+    return np.array([value is not None and key not in dict(value) for value in data.to_pylist()], dtype = bool)
@@ -20,7 +20,7 @@ def validate_schema(file, config):
 
     log(f"Metaschema: {metaschema_uri}", "info")
 
-    metaschema = load_file(metaschema_uri)
+    metaschema = load_file(metaschema_uri, persistent_cache = True)
 
     errors = validate_json_schema(schema, metaschema)
     if len(errors) > 0:
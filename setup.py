@@ -36,6 +36,10 @@ setup(
         "rarfile>=4.0",
     ],
     extras_require={
+        # Streaming validation of large GeoJSON files
+        "geojson": [
+            "ijson>=3.1"
+        ],
         # Optional dependencies for datasets converters go here
         "ie": [
             "zipfile-deflate64"
@@ -20,11 +20,11 @@ def raiser(message):
 def block_stream_file():
     # disable stream_file and load_file so we don't accidentally download urls during test
     # tests become flaky if external sources change / are down
-    def check_path(uri):
+    def check_path(uri, **kwargs):
         # only allow schema.{json|yaml}
         assert not (uri.startswith("https://") and not 'schema.' in uri), \
             f"Should not load external resources during test {uri}"
-        return load_file(uri)
+        return load_file(uri, **kwargs)
 
     stream_file, load_file = convert_utils.stream_file, util.load_file
     convert_utils.stream_file = raiser("convert_utils.stream_file() should not be called during test")
@@ -0,0 +1,77 @@
+import os
+import zipfile
+
+import py7zr
+
+from fiboa_cli.archive import extract, get_members, get_vsizip_paths
+
+
+def create_zip(path, files, compression = zipfile.ZIP_DEFLATED):
+    with zipfile.ZipFile(path, "w", compression = compression) as zip_file:
+        for name in files:
+            zip_file.writestr(name, "test")
+    return str(path)
+
+
+def test_vsizip_paths(tmp_path):
+    archive = create_zip(tmp_path / "a.zip", ["data/a.shp", "data/a.dbf", "data/a.shx", "b.gdb/a00000001.gdbtable"])
+    assert get_vsizip_paths(archive, ["data/a.shp", "b.gdb"]) == [
+        f"/vsizip/{os.path.abspath(archive)}/data/a.shp",
+        f"/vsizip/{os.path.abspath(archive)}/b.gdb",
+    ]
+    # Missing members
+    assert get_vsizip_paths(archive, ["c.shp"]) is None
+
+
+def test_vsizip_extract(tmp_path):
+    # Files that need to be extracted
+    archive = create_zip(tmp_path / "a.zip", ["a.gml", "a.parquet"])
+    assert get_vsizip_paths(archive, ["a.gml"]) is None
+    assert get_vsizip_paths(archive, ["a.parquet"]) is None
+
+    # Compression methods that are not supported by GDAL
+    archive = create_zip(tmp_path / "b.zip", ["a.gpkg"], zipfile.ZIP_BZIP2)
+    assert get_vsizip_paths(archive, ["a.gpkg"]) is None
+
+    # Not a ZIP file
+    other = tmp_path / "c.7z"
+    other.write_bytes(b"test")
+    assert get_vsizip_paths(str(other), ["a.gpkg"]) is None
+
+
+def test_get_members():
+    names = ["a.shp", "a.dbf", "A.prj", "b.shp", "b.dbf", "c.gdb/", "c.gdb/a00000001.gdbtable", "cd.txt"]
+    assert get_members(names, ["a.shp", "c.gdb"]) == ["a.shp", "a.dbf", "A.prj", "c.gdb/", "c.gdb/a00000001.gdbtable"]
+    assert get_members(names, ["d.shp"]) is None
+
+
+def test_extract_zip(tmp_path):
+    archive = create_zip(tmp_path / "a.zip", ["data/a.shp", "data/a.dbf", "data/b.shp", "c.txt"])
+    folder = tmp_path / "extracted"
+    extract(archive, ["data/a.shp"], str(folder), jobs = 2)
+    assert sorted(os.listdir(folder / "data")) == ["a.dbf", "a.shp"]
+    assert not (folder / "c.txt").exists()
+
+    # All files are extracted if no member is given
+    extract(archive, [], str(folder))
+    assert (folder / "c.txt").exists()
+
+
+
+def test_extract_zip_parallel_folders(tmp_path):
+    # Many threads extract files into the same new folders
+    names = [f"data/{i % 3}/{i}.shp" for i in range(100)]
+    archive = create_zip(tmp_path / "a.zip", names)
+    for i in range(20):
+        folder = tmp_path / f"extracted{i}"
+        extract(archive, [], str(folder), jobs = 8)
+        assert sum(len(os.listdir(folder / "data" / str(j))) for j in range(3)) == 100
+
+def test_extract_7z(tmp_path):
+    archive = str(tmp_path / "a.7z")
+    with py7zr.SevenZipFile(archive, "w") as sz_file:
+        for name in ["data/a.shp", "data/a.dbf", "data/b.shp"]:
+            sz_file.writestr("test", name)
+    folder = tmp_path / "extracted"
+    extract(archive, ["data/a.shp"], str(folder))
+    assert sorted(os.listdir(folder / "data")) == ["a.dbf", "a.shp"]
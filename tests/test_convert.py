@@ -1,3 +1,4 @@
+import json
 import re
 from pytest import fixture, mark
 from fiboa_cli import convert, validate
@@ -34,3 +35,39 @@ def test_converter(tmp_file, converter, block_stream_file):
 
     result = runner.invoke(validate, [tmp_file.name, '--data'])
     assert result.exit_code == 0, result.output
+
+
+@mark.parametrize('converter', ['at', 'ch', 'jp', 'ai4sf'])
+def test_converter_chunks(tmp_file, converter, block_stream_file):
+    path = f"tests/data-files/convert/{converter}"
+    runner = CliRunner()
+    args = [converter, '-o', tmp_file.name, '-c', path, '--chunk-size', '30', '--verbose'] + extra_convert_parameters.get(converter, [])
+    result = runner.invoke(convert, args)
+    assert result.exit_code == 0, result.output
+    assert "(first chunk)" in result.output
+
+    result = runner.invoke(validate, [tmp_file.name, '--data'])
+    assert result.exit_code == 0, result.output
+
+
+@mark.parametrize('chunk_size', [None, 30])
+def test_converter_profile(tmp_file, tmp_path, chunk_size, block_stream_file):
+    profile_file = str(tmp_path / "profile.json")
+    args = ['at', '-o', tmp_file.name, '-c', f"{test_path}/at", '--profile', profile_file]
+    if chunk_size is not None:
+        args += ['--chunk-size', str(chunk_size)]
+    result = CliRunner().invoke(convert, args)
+    assert result.exit_code == 0, result.output
+    assert "Peak RSS (MB)" in result.output
+
+    with open(profile_file) as f:
+        profile = json.load(f)
+    assert profile["dataset"] == "at"
+    assert profile["settings"]["chunk_size"] == chunk_size
+    stages = {stage["name"]: stage for stage in profile["stages"]}
+    for name in ["read", "migrate", "filter_rows", "fix_geometries", "post_migrate", "create_collection", "create_parquet"]:
+        assert name in stages
+        assert stages[name]["wall_time"] >= 0
+    assert stages["read"]["rows_out"] == 100
+    assert stages["migrate"]["rows_in"] == 100
+    assert profile["total"]["wall_time"] >= stages["read"]["wall_time"]
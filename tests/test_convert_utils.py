@@ -0,0 +1,136 @@
+import json
+import os
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from fsspec.implementations.local import LocalFileSystem
+from fsspec.implementations.memory import MemoryFileSystem
+from pandas.testing import assert_frame_equal
+from shapely.geometry import MultiPolygon, Polygon, box
+
+from fiboa_cli import convert_utils
+from fiboa_cli.convert_utils import BaseConverter, download_file, fix_geometries, map_chunks
+from fiboa_cli.download_cache import get_remote_info
+
+
+def test_download_file_resume(tmp_path):
+    fs = LocalFileSystem()
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"0123456789")
+    target = tmp_path / "target.bin"
+    # An interrupted download, the content differs from the source to check that the download is resumed
+    (tmp_path / "target.bin.part").write_bytes(b"ABCDE")
+    (tmp_path / "target.bin.part.json").write_text(json.dumps(get_remote_info(fs, str(source))))
+
+    download_file(fs, str(source), fs, str(target))
+    assert target.read_bytes() == b"ABCDE56789"
+    assert not (tmp_path / "target.bin.part").exists()
+    assert not (tmp_path / "target.bin.part.json").exists()
+
+
+def test_download_file_resume_changed(tmp_path):
+    fs = LocalFileSystem()
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"0123456789")
+    target = tmp_path / "target.bin"
+    (tmp_path / "target.bin.part").write_bytes(b"01234")
+    (tmp_path / "target.bin.part.json").write_text(json.dumps(get_remote_info(fs, str(source))))
+
+    # The source has changed since the download was interrupted, but has the same size
+    source.write_bytes(b"abcdefghij")
+    os.utime(source, (0, 0))
+    download_file(fs, str(source), fs, str(target))
+    assert target.read_bytes() == b"abcdefghij"
+
+    # Partial downloads that can't be checked are not resumed
+    (tmp_path / "target.bin.part").write_bytes(b"01234")
+    download_file(fs, str(source), fs, str(target))
+    assert target.read_bytes() == b"abcdefghij"
+
+
+def test_download_files_changed_source(tmp_path, monkeypatch):
+    fs = MemoryFileSystem()
+    monkeypatch.setattr(convert_utils, "get_fs", lambda uri: fs if uri.startswith("memory://") else LocalFileSystem())
+
+    def upload(content):
+        archive = tmp_path / "upload.zip"
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("data.json", content)
+        fs.put_file(str(archive), "memory://source/a.zip")
+
+    converter = BaseConverter(id="test", short_name="test", title="Test", license="CC-BY-4.0", columns={"id": "id"})
+    cache = str(tmp_path / "cache")
+    uris = {"memory://source/a.zip": ["data.json"]}
+
+    upload("old")
+    [(path, _)] = converter.download_files(uris, cache)
+    with open(path) as f:
+        assert f.read() == "old"
+
+    # The cached archive and the extracted files must be replaced if the source has changed
+    upload("changed")
+    [(path, _)] = converter.download_files(uris, cache)
+    assert os.path.exists(path)
+    with open(path) as f:
+        assert f.read() == "changed"
+
+
+def test_read_data_parallel():
+    # Lambdas can't be pickled, so the converter is sent to forked processes
+    converter = BaseConverter(id="test", short_name="test", title="Test", license="CC-BY-4.0", columns={"id": "id"},
+                              column_filters={"id": lambda col: col.notna()})
+    paths = [
+        ("tests/data-files/convert/ai4sf/1_vietnam_areas.gpkg", "vietnam"),
+        ("tests/data-files/convert/ai4sf/4_cambodia_areas.gpkg", "cambodia"),
+    ]
+    expected = converter.read_data(paths)
+    actual = converter.read_data(paths, jobs=2)
+    assert_frame_equal(actual, expected)
+
+
+def test_get_read_columns():
+    def migrate(gdf):
+        return gdf
+
+    args = dict(id="test", short_name="test", title="Test", license="CC-BY-4.0", columns={"id": "id", "geometry": "geometry"})
+    converter = BaseConverter(column_filters={"type": lambda col: col == "A"}, **args)
+    assert converter.get_read_columns() == ["geometry", "id", "type"]
+
+    # Custom migrations may need any column
+    converter = BaseConverter(migrate=migrate, **args)
+    assert converter.get_read_columns() is None
+
+    converter = BaseConverter(migrate=migrate, read_columns={"code"}, **args)
+    assert converter.get_read_columns() == ["code", "geometry", "id"]
+
+    gdf = converter.read_data([("tests/data-files/convert/ai4sf/1_vietnam_areas.gpkg", "vietnam")])
+    assert list(gdf.columns) == ["id", "geometry"]
+
+
+def test_fix_geometries():
+    valid = box(0, 0, 1, 1)
+    # Bowtie polygon
+    invalid = Polygon([(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)])
+    multi = MultiPolygon([box(0, 0, 1, 1), box(2, 2, 3, 3)])
+    gdf = gpd.GeoDataFrame({"id": [6, 5, 4, 3, 2, 1]}, geometry=[valid, invalid, multi, invalid, None, valid], index=[6, 5, 4, 3, 2, 1], crs="EPSG:4326")
+
+    actual, stats = fix_geometries(gdf.copy(), jobs=2)
+    expected = gdf.copy()
+    expected.geometry = expected.geometry.make_valid()
+    expected = expected.explode()
+    # Missing geometries are neither repaired nor counted
+    assert stats == {"repaired": 2, "exploded": 3, "parts": 6}
+    # explode drops rows without geometry
+    assert len(actual) == 8
+    assert list(actual.index) == list(expected.index)
+    assert actual.crs == gdf.crs
+    assert actual.geom_equals(expected.geometry).all()
+    assert actual.is_valid.all()
+
+
+def test_map_chunks():
+    data = np.array([box(i, i, i + 1, i + 1) for i in range(5)])
+    actual = map_chunks(shapely.area, data, jobs=2, chunk_size=2)
+    assert list(actual) == [1.0] * 5
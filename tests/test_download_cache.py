@@ -0,0 +1,47 @@
+import hashlib
+import os
+
+from fsspec.implementations.local import LocalFileSystem
+
+from fiboa_cli.convert_utils import download_file
+from fiboa_cli.download_cache import create_entry, evict, is_valid, load_manifest, save_manifest
+
+
+def test_entry(tmp_path):
+    fs = LocalFileSystem()
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"0123456789")
+    cached = tmp_path / "cache.bin"
+
+    sha256 = download_file(fs, str(source), fs, str(cached))
+    assert sha256 == hashlib.sha256(b"0123456789").hexdigest()
+    entry = create_entry(str(source), str(cached), sha256, {"size": 10})
+    assert is_valid(entry, str(cached), fs, str(source))
+
+    # Truncated file
+    cached.write_bytes(b"01234")
+    assert not is_valid(entry, str(cached), fs, str(source))
+
+    # Changed source
+    cached.write_bytes(b"0123456789")
+    entry = create_entry(str(source), str(cached), sha256, {"size": 10})
+    source.write_bytes(b"01234567890")
+    assert not is_valid(entry, str(cached), fs, str(source))
+
+
+def test_evict(tmp_path):
+    manifest = {}
+    for i, name in enumerate(["a.zip", "b.gpkg", "c.gpkg"]):
+        (tmp_path / name).write_bytes(b"x" * 100)
+        manifest[name] = {"url": f"https://example.com/{name}", "last_used": i}
+    (tmp_path / "extracted.a").mkdir()
+    (tmp_path / "extracted.a" / "a.shp").write_bytes(b"x" * 100)
+    # Not managed
+    (tmp_path / "d.gpkg").write_bytes(b"x" * 1000)
+
+    save_manifest(str(tmp_path), manifest)
+    manifest = load_manifest(str(tmp_path))
+    removed = evict(str(tmp_path), manifest, 150, keep = ["c.gpkg"])
+    assert removed == ["a.zip", "b.gpkg"]
+    assert list(manifest.keys()) == ["c.gpkg"]
+    assert sorted(os.listdir(tmp_path)) == ["c.gpkg", "d.gpkg", "manifest.json"]
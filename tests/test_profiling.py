@@ -0,0 +1,46 @@
+import json
+import time
+
+from fiboa_cli.profiling import Profile, write_profile
+
+
+def test_profile_stages(tmp_path):
+    profile = Profile("test", jobs = 2)
+    for rows in [10, 5]:
+        with profile.stage("migrate", rows) as stage:
+            time.sleep(0.01)
+            stage["rows_out"] = rows - 1
+    chunks = list(profile.iterate("read", [[1, 2], [3]]))
+    profile.finish()
+
+    assert chunks == [[1, 2], [3]]
+    migrate = profile.stages["migrate"]
+    assert migrate["calls"] == 2
+    assert migrate["wall_time"] >= 0.02
+    assert migrate["rows_in"] == 15
+    assert migrate["rows_out"] == 13
+    # One call per item and one for the end of the iterable
+    assert profile.stages["read"]["calls"] == 3
+    assert profile.stages["read"]["rows_in"] is None
+    assert profile.stages["read"]["rows_out"] == 3
+    assert profile.get_total()["wall_time"] >= migrate["wall_time"]
+
+    path = tmp_path / "profile.json"
+    write_profile(str(path), profile)
+    data = json.loads(path.read_text())
+    assert data["dataset"] == "test"
+    assert data["settings"] == {"jobs": 2}
+    assert [stage["name"] for stage in data["stages"]] == ["migrate", "read"]
+
+
+def test_profile_summary():
+    profile = Profile()
+    with profile.stage("download"):
+        pass
+    messages = []
+    profile.log_summary(lambda text, status: messages.append(text))
+    assert messages[0] == "Profile:"
+    assert messages[1].split() == ["Stage", "Wall", "(s)", "CPU", "(s)", "Peak", "RSS", "(MB)", "Rows", "in", "Rows", "out"]
+    assert messages[2].startswith("download")
+    assert messages[2].split()[-2:] == ["-", "-"]
+    assert messages[3].startswith("total")
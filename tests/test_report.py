@@ -0,0 +1,113 @@
+import json
+import os
+
+import pyarrow as pa
+import pytest
+
+import pyarrow.parquet as pq
+from jsonschema import Draft202012Validator
+
+from fiboa_cli.report import Report, describe_error, write_reports
+from fiboa_cli.validate_data import Issue
+
+SCHEMA = {
+    "type": "object",
+    "required": ["id", "properties"],
+    "properties": {
+        "properties": {
+            "type": "object",
+            "required": ["area"],
+            "properties": {"area": {"type": "number", "exclusiveMinimum": 0}},
+        },
+    },
+}
+
+
+def check(feature):
+    return [describe_error(error) for error in Draft202012Validator(SCHEMA).iter_errors(feature)]
+
+
+def test_group_feature_errors():
+    report = Report("test.json")
+    for i in range(8):
+        report.add_feature_errors(i, check({"id": i, "properties": {"area": -i}}))
+    report.add_feature_errors(8, check({"id": 8, "properties": {}}))
+
+    assert list(report.issues.keys()) == ["area"]
+    minimum, required = report.issues["area"]
+    assert minimum.rule == "exclusiveMinimum"
+    assert minimum.count == 8
+    assert minimum.samples == [0, 1, 2, 3, 4]
+    assert str(minimum) == "0 is less than or equal to the minimum of 0 (8 features, e.g. 0, 1, 2, 3, 4)"
+    assert str(required) == "'area' is a required property (feature 8)"
+
+
+def test_log_issues():
+    report = Report("test.parquet")
+    report.add_issues("geometry", [Issue("valid", f"Reason {i}", 2, [i], f"Reason {i}") for i in range(4)])
+    messages = []
+    report.log_issues(lambda text, status: messages.append(text), max_issues = 2)
+    assert messages == [
+        "geometry: Reason 0 (2 rows, e.g. 0)",
+        "geometry: Reason 1 (2 rows, e.g. 1)",
+        "geometry: 2 more issues affecting 4 rows",
+    ]
+
+    issues = report.to_dict()["issues"]
+    assert len(issues) == 4
+    assert issues[0] == {
+        "column": "geometry", "rule": "valid", "detail": "Reason 0", "message": "Reason 0",
+        "count": 2, "unit": "row", "examples": [0],
+    }
+
+
+def test_write_reports(tmp_path):
+    report = Report("test.parquet")
+    report.valid = False
+    report.rows = 3
+    report.timings = {"data": 0.5, "total": 1.0}
+    report.columns = {"area": {"rows": 3, "bytes": 100, "seconds": 0.4, "rules": {"minimum": {"rows": 3, "violations": 2, "seconds": 0.1}}}}
+    report.add_issues("area", [Issue("minimum", "Value -1 is less than the minimum allowed value of 0.", 2, [0, 1])])
+
+    path = str(tmp_path / "log.parquet")
+    write_reports(path, [report])
+    write_reports(path, [report])
+    # One file per run
+    assert len(os.listdir(path)) == 2
+    records = pq.read_table(path).to_pylist()
+    assert len(records) == 8
+    assert [r["kind"] for r in records[:4]] == ["file", "stage", "column", "rule"]
+    assert records[2]["violations"] == 2
+    assert records[3]["rule"] == "minimum"
+    assert records[3]["seconds"] == 0.1
+
+    path = str(tmp_path / "report.json")
+    write_reports(path, [report])
+    with open(path) as f:
+        assert json.load(f)[0]["columns"]["area"]["bytes"] == 100
+
+
+def test_write_reports_incompatible(tmp_path):
+    path = tmp_path / "log.parquet"
+    path.mkdir()
+    pq.write_table(pa.table({"file": ["a"], "rows": ["many"]}), str(path / "old.parquet"))
+    with pytest.raises(ValueError, match = "incompatible schema"):
+        write_reports(str(path), [Report("test.parquet")])
+
+    file = tmp_path / "file.parquet"
+    file.write_bytes(b"")
+    with pytest.raises(ValueError, match = "must be a folder"):
+        write_reports(str(file), [Report("test.parquet")])
+
+
+def test_log_sampled_issues():
+    report = Report("test.parquet")
+    report.sampled_rows = 300
+    report.sampled_row_groups = {0: 100, 3: 100, 7: 100}
+    report.total_row_groups = 10
+    issue = Issue("minimum", "Too small", 30, [0])
+    issue.row_groups = {3: 30}
+    report.add_issues("area", [issue])
+    messages = []
+    report.log_issues(lambda text, status: messages.append(text))
+    assert messages == ["area: Too small (30 rows, e.g. 0) - estimated violation rate: 10.0000% (95% confidence interval: 0.0000% to 26.3985%)"]
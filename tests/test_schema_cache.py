@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+
+from fiboa_cli import schema_cache, util
+
+URL = "https://fiboa.github.io/specification/v0.2.0/schema.yaml"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(schema_cache.settings, "directory", str(tmp_path))
+    monkeypatch.setitem(schema_cache.settings, "ttl", 3600)
+    monkeypatch.setitem(schema_cache.settings, "offline", False)
+    monkeypatch.setitem(schema_cache.settings, "enabled", True)
+    return schema_cache
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_offline(cache, monkeypatch):
+    monkeypatch.setitem(cache.settings, "offline", True)
+    with pytest.raises(Exception, match="offline"):
+        cache.fetch(URL)
+
+    cache.store(URL, b"type: object")
+    assert cache.fetch(URL) == b"type: object"
+
+    monkeypatch.delitem(util.file_cache, URL, raising=False)
+    assert util.load_file(URL, persistent_cache = True) == {"type": "object"}
+
+
+def test_revalidate(cache, monkeypatch):
+    requests = []
+
+    def download(uri, headers = {}):
+        requests.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return None, Response({})
+        return b'{"a": 1}', Response({"ETag": '"v1"'})
+
+    monkeypatch.setattr(schema_cache, "download", download)
+    assert json.loads(cache.fetch(URL)) == {"a": 1}
+    # Fresh entries are used without a request
+    assert json.loads(cache.fetch(URL)) == {"a": 1}
+    assert len(requests) == 1
+
+    # Expired entries are revalidated with the ETag
+    monkeypatch.setitem(cache.settings, "ttl", 0)
+    assert json.loads(cache.fetch(URL)) == {"a": 1}
+    assert requests == [{}, {"If-None-Match": '"v1"'}]
+
+
+def test_load_file_schemas_only(cache, monkeypatch):
+    collection = "https://example.com/collection.json"
+    cache.store(URL, b"type: object")
+    cache.store(collection, b'{"cached": true}')
+    monkeypatch.setitem(cache.settings, "offline", True)
+    monkeypatch.delitem(util.file_cache, URL, raising=False)
+    monkeypatch.delitem(util.file_cache, collection, raising=False)
+
+    assert util.load_fiboa_schema({"fiboa_version": "0.2.0"}) == {"type": "object"}
+
+    # Other files such as collections bypass the schema cache
+    class FileSystem:
+        def open(self, uri):
+            return io.BytesIO(b'{"cached": false}')
+
+    monkeypatch.setattr(util, "get_fs", lambda uri: FileSystem())
+    assert util.load_file(collection) == {"cached": False}
+
+
+def test_clear(cache):
+    cache.store(URL, b"type: object")
+    cache.clear()
+    assert cache.read_entry(URL) is None
+
+
+@pytest.mark.parametrize("value, ttl", [(None, 86400), ("60", 60), ("1d", 86400)])
+def test_env_ttl(monkeypatch, capsys, value, ttl):
+    if value is None:
+        monkeypatch.delenv("FIBOA_CACHE_TTL", raising=False)
+    else:
+        monkeypatch.setenv("FIBOA_CACHE_TTL", value)
+    assert schema_cache.get_env_ttl() == ttl
+    assert ("Invalid value for FIBOA_CACHE_TTL" in capsys.readouterr().err) == (value == "1d")
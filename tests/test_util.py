@@ -0,0 +1,64 @@
+import json
+
+import click
+import pytest
+
+from fiboa_cli import util
+from fiboa_cli.util import create_validator, is_geojsonseq, iter_geojson, iter_geojsonseq, load_geojson_header, parse_sample
+
+
+def test_create_validator_cache():
+    schema = {"$schema": "https://json-schema.org/draft/2020-12/schema", "type": "object"}
+    validator = create_validator(schema)
+    assert create_validator(schema) is validator
+    # Equal schemas that are different objects get their own validator
+    assert create_validator(dict(schema)) is not validator
+
+
+def test_create_validator_cache_size(monkeypatch):
+    monkeypatch.setattr(util, "VALIDATOR_CACHE_SIZE", 2)
+    schemas = [{"$schema": "https://json-schema.org/draft/2020-12/schema", "type": "object"} for _ in range(3)]
+    first = create_validator(schemas[0])
+    for schema in schemas[1:]:
+        create_validator(schema)
+    # Only the most recently used validators are kept
+    assert len(util.validator_cache) <= 2
+    assert create_validator(schemas[2]) is create_validator(schemas[2])
+    assert create_validator(schemas[0]) is not first
+
+
+def test_iter_geojsonseq(tmp_path):
+    path = tmp_path / "features.geojsonl"
+    path.write_text('\x1e{"type": "Feature", "id": 1}\n\n{"type": "Feature", "id": 2}\n')
+    assert is_geojsonseq(str(path))
+    assert [f["id"] for f in iter_geojsonseq(str(path))] == [1, 2]
+
+
+def test_stream_geojson(tmp_path):
+    pytest.importorskip("ijson")
+    path = tmp_path / "features.json"
+    path.write_text(json.dumps({
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": 1, "properties": {"area": 1.5}}, {"type": "Feature", "id": 2}],
+        "fiboa": {"fiboa_version": "0.2.0", "fiboa_extensions": []},
+    }))
+    assert load_geojson_header(str(path)) == {
+        "type": "FeatureCollection",
+        "fiboa": {"fiboa_version": "0.2.0", "fiboa_extensions": []},
+    }
+    # Members that follow the features are not read in a single pass
+    header, *features = iter_geojson(str(path))
+    assert header == {"type": "FeatureCollection"}
+    assert [f["id"] for f in features] == [1, 2]
+    assert features[0]["properties"]["area"] == 1.5
+
+
+def test_parse_sample():
+    assert parse_sample(None, None, "100000") == 100000
+    assert parse_sample(None, None, "1 rows") == 1
+    assert parse_sample(None, None, "0.1") == 0.1
+    assert parse_sample(None, None, "1.0") == 1.0
+    assert parse_sample(None, None, "25%") == 0.25
+    for value in ["1", "0", "1.5", "200%", "abc"]:
+        with pytest.raises(click.BadParameter):
+            parse_sample(None, None, value)
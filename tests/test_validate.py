@@ -1,3 +1,9 @@
+import importlib
+import json
+
+import pytest
+import pyarrow.parquet as pq
+
 from fiboa_cli import validate
 from click.testing import CliRunner
 
@@ -11,3 +17,123 @@ def test_validate():
     assert "- https://fiboa.github.io/inspire-extension/v0.2.0/schema.yaml" in result.output
     assert "Data was not validated" not in result.output
     assert "=> VALID" in result.output
+
+
+def test_validate_batches():
+    path = f"tests/data-files/merge/at.parquet"
+    runner = CliRunner()
+    result = runner.invoke(validate, [path, '--data', '--batch-size', '10'])
+    assert result.exit_code == 0, result.output
+    assert "Data was not validated" not in result.output
+    assert "=> VALID" in result.output
+
+
+def test_validate_parallel():
+    files = ["tests/data-files/inspire.parquet", "tests/data-files/merge/at.parquet"]
+    runner = CliRunner()
+    result = runner.invoke(validate, files + ['--data', '--jobs', '2'])
+    assert result.exit_code == 0, result.output
+    # Logs are not interleaved
+    first = result.output.index("Validating tests/data-files/inspire.parquet")
+    second = result.output.index("Validating tests/data-files/merge/at.parquet")
+    assert result.output.index("=> VALID", first) < second
+
+
+def test_validate_threads():
+    path = f"tests/data-files/merge/at.parquet"
+    runner = CliRunner()
+    result = runner.invoke(validate, [path, '--data', '--threads', '4'])
+    assert result.exit_code == 0, result.output
+    assert "=> VALID" in result.output
+
+
+def test_validate_metadata_once(monkeypatch):
+    # The footer of the file is read once, not once per column
+    module = importlib.import_module("fiboa_cli.validate")
+    calls = []
+    load_parquet_metadata = module.load_parquet_metadata
+    monkeypatch.setattr(module, "load_parquet_metadata", lambda uri: calls.append(uri) or load_parquet_metadata(uri))
+    result = CliRunner().invoke(validate, ["tests/data-files/inspire.parquet", "--data", "--threads", "2"])
+    assert result.exit_code == 0, result.output
+    assert len(calls) == 1
+
+def test_validate_sample(tmp_path):
+    # Write the file with 10 row groups
+    path = str(tmp_path / "at.parquet")
+    table = pq.read_table("tests/data-files/merge/at.parquet")
+    pq.write_table(table, path, row_group_size = 10)
+
+    runner = CliRunner()
+    result = runner.invoke(validate, [path, '--data', '--sample', '30%', '--seed', '1'])
+    assert result.exit_code == 0, result.output
+    assert "Validating a random sample of 30 of 100 rows (3 of 10 row groups)" in result.output
+    assert "No violations found in the sample, less than 63.16% of the row groups contain violations" in result.output
+    # The same row groups are picked for the same seed
+    again = runner.invoke(validate, [path, '--data', '--sample', '0.3', '--seed', '1'])
+    assert again.output == result.output
+
+    # No estimates if the sample covers the whole file
+    result = runner.invoke(validate, [path, '--data', '--sample', '1.0'])
+    assert result.exit_code == 0, result.output
+    assert "random sample" not in result.output
+    assert "No violations found in the sample" not in result.output
+
+    result = runner.invoke(validate, [path, '--data', '--sample', '1'])
+    assert result.exit_code == 2
+    assert "ambiguous" in result.output
+
+
+def test_validate_geojson_jobs(tmp_path, monkeypatch):
+    # fiboa_cli.validate is the command, so get the module explicitly
+    monkeypatch.setattr(importlib.import_module("fiboa_cli.validate"), "FEATURE_CHUNK_SIZE", 2)
+    with open("tests/data-files/inspire.json") as f:
+        feature = json.load(f)
+    features = []
+    for i in range(5):
+        features.append(dict(feature, id = str(i)))
+    path = tmp_path / "features.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features, "fiboa": feature["fiboa"]}))
+
+    runner = CliRunner()
+    sequential = runner.invoke(validate, [str(path)])
+    parallel = runner.invoke(validate, [str(path), '--jobs', '2'])
+    assert parallel.exit_code == sequential.exit_code == 0, parallel.output
+    # Results are reported in the order of the features
+    assert parallel.output == sequential.output
+
+
+def test_load_geojson_streaming(tmp_path, monkeypatch):
+    pytest.importorskip("ijson")
+    module = importlib.import_module("fiboa_cli.validate")
+    monkeypatch.setattr(module, "GEOJSON_STREAMING_SIZE", 0)
+    features = [{"type": "Feature", "id": 1}, {"type": "Feature", "id": 2}]
+    fiboa = {"fiboa_version": "0.2.0"}
+
+    # The members before the features are sufficient, the file is parsed once
+    path = tmp_path / "before.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "fiboa": fiboa, "features": features}))
+    header, iterator = module.load_geojson(str(path))
+    assert header == {"type": "FeatureCollection", "fiboa": fiboa}
+    assert [f["id"] for f in iterator] == [1, 2]
+
+    # The fiboa member follows the features, so it's read in a separate pass
+    path = tmp_path / "after.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features, "fiboa": fiboa}))
+    header, iterator = module.load_geojson(str(path))
+    assert header == {"type": "FeatureCollection", "fiboa": fiboa}
+    assert [f["id"] for f in iterator] == [1, 2]
+
+    # Not needed if a collection is provided
+    header, iterator = module.load_geojson(str(path), "collection.json")
+    assert header == {"type": "FeatureCollection"}
+
+def test_validate_json():
+    path = f"tests/data-files/merge/at.parquet"
+    runner = CliRunner()
+    result = runner.invoke(validate, [path, '--data', '--format', 'json'])
+    assert result.exit_code == 0, result.output
+    reports = json.loads(result.output)
+    assert len(reports) == 1
+    assert reports[0]["file"] == path
+    assert reports[0]["valid"] is True
+    assert reports[0]["issues"] == []
@@ -0,0 +1,174 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+
+from fiboa_cli import validate_data
+from fiboa_cli.validate_data import estimate_violation_rate, has_checks, merge_issues, remove_proven_rules, row_groups_upper_bound, validate_column
+
+
+def test_numerical():
+    data = pa.chunked_array([[1.5, 0.0, None], [float("nan"), -2.0, 3.0]])
+    issues = validate_column(data, {"type": "double", "exclusiveMinimum": 0, "maximum": 2})
+    assert len(issues) == 2
+
+    maximum, minimum = issues
+    assert minimum.rule == "exclusiveMinimum"
+    assert minimum.count == 2
+    assert minimum.samples == [1, 4]
+    assert minimum.message == "Value 0.0 is less than or equal to the exclusive minimum value of 0."
+    assert maximum.rule == "maximum"
+    assert maximum.count == 1
+    assert str(maximum) == "Value 3.0 is greater than the maximum allowed value of 2. (row 5)"
+
+
+def test_numerical_enum():
+    data = pa.array([1, 2, 3, None], type=pa.uint8())
+    issues = validate_column(data, {"type": "uint8", "enum": [1, 2]})
+    assert len(issues) == 1
+    assert issues[0].message == "Integer '3' is not one of the allowed values in the enumeration: 1, 2"
+
+
+def test_string():
+    data = pa.array(["abc", "a", None, "abcdef"])
+    rules = {"type": "string", "minLength": 2, "maxLength": 5, "pattern": "^a"}
+    issues = validate_column(data, rules, offset=100)
+    assert [i.rule for i in issues] == ["minLength", "maxLength"]
+    assert issues[0].samples == [101]
+    assert issues[1].samples == [103]
+
+
+def test_string_pattern_fallback():
+    # Lookaheads are not supported by pyarrow's regular expressions
+    data = pa.array(["ab", "ac", "ab"])
+    issues = validate_column(data, {"type": "string", "pattern": "a(?=b)"})
+    assert len(issues) == 1
+    assert issues[0].message == "String 'ac' does not match the required pattern: a(?=b)."
+
+
+def test_string_format_and_enum():
+    data = pa.array(["https://fiboa.org", "fiboa.org"])
+    issues = validate_column(data, {"type": "string", "format": "uri", "enum": ["https://fiboa.org"]})
+    assert [i.rule for i in issues] == ["enum", "format"]
+    assert issues[1].message == "String 'fiboa.org' is not a valid URI."
+
+
+def test_array():
+    data = pa.array([[1, 2], [1, 1], [], None])
+    issues = validate_column(data, {"type": "array", "minItems": 1, "uniqueItems": True, "items": {"type": "int64"}})
+    assert [(i.rule, i.samples) for i in issues] == [("minItems", [2]), ("uniqueItems", [1])]
+
+
+def test_object():
+    data = pa.array([[("a", 1)], [("b", 2)], None], type=pa.map_(pa.string(), pa.int32()))
+    issues = validate_column(data, {"type": "object", "properties": {"a": {"type": "int32"}}})
+    assert len(issues) == 1
+    assert str(issues[0]) == "Key 'a' is missing from the object. (row 1)"
+
+
+def test_bbox():
+    data = pa.array([
+        {"xmin": 0.0, "ymin": 0.0, "xmax": 1.0, "ymax": 1.0},
+        {"xmin": 2.0, "ymin": 0.0, "xmax": 1.0, "ymax": 1.0},
+    ])
+    issues = validate_column(data, {"type": "bounding-box"})
+    assert len(issues) == 1
+    assert issues[0].message == "Bounding box has xmin value greater than xmax value: 2.0 > 1.0"
+
+
+def test_geometry():
+    geometries = [
+        shapely.box(0, 0, 1, 1),
+        shapely.Point(0, 0),
+        shapely.Polygon([(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)]),
+        None,
+    ]
+    data = pa.array(shapely.to_wkb(geometries), type=pa.binary())
+    issues = validate_column(data, {"type": "geometry", "geometryTypes": ["Polygon"]})
+    assert [(i.rule, i.samples) for i in issues] == [("geometryTypes", [1]), ("valid", [2])]
+    assert issues[0].message == "Geometry type 'Point' is not one of the allowed types: Polygon"
+    assert "is not valid: Self-intersection" in issues[1].message
+
+
+def test_merge_issues():
+    rules = {"type": "int64", "minimum": 0}
+    issues = validate_column(pa.array([-1, -2, 1]), rules)
+    merge_issues(issues, validate_column(pa.array([1, -3, -4, -5, -6]), rules, offset=3))
+    assert len(issues) == 1
+    assert issues[0].count == 6
+    assert issues[0].samples == [0, 1, 4, 5, 6]
+    assert issues[0].message == "Value -1 is less than the minimum allowed value of 0."
+
+
+def test_geometry_grouped():
+    bowtie = shapely.Polygon([(0, 0), (1, 1), (1, 0), (0, 1), (0, 0)])
+    geometries = [bowtie, shapely.box(0, 0, 1, 1), bowtie, shapely.Point(0, 0), shapely.LineString([(0, 0), (1, 1)])]
+    data = pa.array(shapely.to_wkb(geometries), type=pa.binary())
+    issues = validate_column(data, {"type": "geometry", "geometryTypes": ["Polygon"]}, offset=10)
+    assert [(i.rule, i.detail, i.count, i.samples) for i in issues] == [
+        ("geometryTypes", "Point", 1, [13]),
+        ("geometryTypes", "LineString", 1, [14]),
+        ("valid", "Self-intersection", 2, [10, 12]),
+    ]
+
+
+def test_geometry_chunks(monkeypatch):
+    monkeypatch.setattr(validate_data, "GEOMETRY_CHUNK_SIZE", 2)
+    point = shapely.to_wkb(shapely.Point(0, 0))
+    box = shapely.to_wkb(shapely.box(0, 0, 1, 1))
+    data = pa.chunked_array([[box, point, box], [box, point]], type=pa.binary())
+    issues = validate_column(data, {"type": "geometry", "geometryTypes": ["Polygon"]})
+    assert len(issues) == 1
+    assert issues[0].count == 2
+    assert issues[0].samples == [1, 4]
+
+
+def test_remove_proven_rules(tmp_file):
+    table = pa.table({
+        "area": pa.array([1.0, 2.0, 3.0, 0.0], type=pa.float32()),
+        "code": pa.array(["a", "a", "a", "b"]),
+        "empty": pa.array([None, None, None, None], type=pa.int32()),
+    })
+    pq.write_table(table, tmp_file.name, row_group_size=3)
+    metadata = pq.read_metadata(tmp_file.name)
+
+    area = {"type": "float", "exclusiveMinimum": 0, "maximum": 100000}
+    assert remove_proven_rules(area, metadata.row_group(0).column(0)) == {"type": "float"}
+    assert remove_proven_rules(area, metadata.row_group(1).column(0)) == {"type": "float", "exclusiveMinimum": 0}
+
+    code = {"type": "string", "enum": ["a"], "minLength": 1}
+    assert remove_proven_rules(code, metadata.row_group(0).column(1)) == {"type": "string", "minLength": 1}
+    assert remove_proven_rules(code, metadata.row_group(1).column(1)) == code
+
+    empty = {"type": "int32", "minimum": 1}
+    assert remove_proven_rules(empty, metadata.row_group(0).column(2)) == {"type": "int32"}
+    assert not has_checks({"type": "int32"})
+
+
+def test_estimate_violation_rate():
+    rows = {i: 100 for i in range(10)}
+    # Violations spread evenly over the row groups
+    rate, low, high = estimate_violation_rate({i: 5 for i in range(10)}, rows, 100)
+    assert rate == 0.05
+    assert low == high == 0.05
+    # The same number of violations clustered in a single row group is much less certain
+    rate, low, high = estimate_violation_rate({0: 50}, rows, 100)
+    assert rate == 0.05
+    assert low == 0
+    assert high > 0.1
+    # The whole file has been sampled
+    assert estimate_violation_rate({0: 50}, rows, 10) == (0.05, 0.05, 0.05)
+    # A single row group says nothing about the others
+    assert estimate_violation_rate({0: 5}, {0: 100}, 100) == (0.05, 0.0, 1.0)
+
+    assert 0.25 < row_groups_upper_bound(10) < 0.26
+
+
+def test_stats():
+    stats = {}
+    rules = {"type": "int64", "minimum": 0, "maximum": 10}
+    validate_column(pa.array([-1, 5, 11]), rules, stats = stats)
+    validate_column(pa.array([-2, 5]), rules, stats = stats)
+    assert stats["minimum"]["rows"] == 5
+    assert stats["minimum"]["violations"] == 2
+    assert stats["maximum"]["violations"] == 1
+    assert stats["maximum"]["seconds"] > 0